@@ -1,14 +1,22 @@
 """
 Скрипт для нагрузочного тестирования Vector Store
 Тестирует 2000 запросов одновременно
+
+Чтобы убедиться, что время уходит на сервер, а не на клиента, профиль
+снимается флагом --profile client.prof, а семплирующим профайлером так:
+    py-spy record -o client.svg -- python load_test.py --mode vectorstore
 """
 
+import argparse
 import asyncio
 import aiohttp
+import cProfile
+import itertools
 import time
-import json
-import statistics
-from typing import List, Dict, Any
+import orjson
+import numpy as np
+import pstats
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -17,7 +25,9 @@ logger = logging.getLogger(__name__)
 VECTORSTORE_URL = "http://localhost:8002"
 REQUEST_PROCESSOR_URL = "http://localhost:8004"
 TOTAL_REQUESTS = 2000
+WARMUP_REQUESTS = 50  # Запросов прогрева, не входят в результаты
 CONCURRENT_REQUESTS = 100  # Максимум одновременных запросов
+SEARCH_BATCH_SIZE = 32  # Запросов в одном вызове /search-batch
 QUERIES = [
     "музыка",
     "книга",
@@ -31,176 +41,399 @@ QUERIES = [
     "публикация"
 ]
 
+# Тело запроса кодируется orjson сразу в bytes, заголовок задается явно
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Таймаут создается один раз, а не на каждый запрос
+REQUEST_TIMEOUT = 30
+AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+def use_eager_tasks():
+    """Запускать задачи сразу при создании (Python 3.12+)"""
+    # Синхронная часть запроса выполняется без прохода через очередь event loop,
+    # и накладные расходы клиента не попадают в измеренную задержку
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
 class LoadTester:
-    def __init__(self):
+    def __init__(self, client_cache: bool = False, client: str = "aiohttp",
+                 total_requests: int = TOTAL_REQUESTS, concurrency: int = CONCURRENT_REQUESTS,
+                 warmup_requests: int = WARMUP_REQUESTS, batch_size: int = SEARCH_BATCH_SIZE):
         self.results: List[Dict[str, Any]] = []
-        self.semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
+        self.total_requests = total_requests
+        self.concurrency = concurrency
+        self.warmup_requests = warmup_requests
+        self.batch_size = batch_size
+        # HTTP-клиент: aiohttp или httpx для сравнения
+        self.client = client
+        # Кэш ответов по тексту запроса: повторы не уходят в сеть. Выключен
+        # по умолчанию, иначе тест измерял бы клиента, а не Vector Store
+        self.client_cache = client_cache
+        self._response_cache: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Все задачи прогона стартуют сразу: лишние ждут слот здесь, а не
+        # в пуле соединений, где ожидание попадало бы в таймаут и задержку
+        self._slots = asyncio.Semaphore(concurrency)
+        # Тело поиска зависит только от запроса: кодируем один раз на запрос
+        self._search_payloads = {
+            query: orjson.dumps({"query": query, "top_k": 5, "threshold": 0.5})
+            for query in QUERIES
+        }
+        self._process_templates = {
+            query: {"query": query, "services": ["vectorstore"]}
+            for query in QUERIES
+        }
+        # План прогона (номер запроса, текст) строится один раз и переиспользуется
+        self._plan: List[Tuple[int, str]] = list(zip(
+            range(total_requests),
+            itertools.islice(itertools.cycle(QUERIES), total_requests)
+        ))
     
-    async def make_request(self, session: aiohttp.ClientSession, query: str, request_id: int) -> Dict[str, Any]:
-        """Выполняет один запрос к Vector Store"""
-        async with self.semaphore:
-            start_time = time.time()
+    def _get_session(self):
+        """Общая сессия: пул соединений переживает последовательные прогоны"""
+        if self.client == "httpx":
+            if self._session is None or self._session.is_closed:
+                import httpx
+                self._session = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.concurrency,
+                        max_keepalive_connections=self.concurrency,
+                        keepalive_expiry=60
+                    )
+                )
+            return self._session
+        
+        if self._session is None or self._session.closed:
+            # Пул по размеру семафора: запрос со слотом сразу получает соединение
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
+    async def close(self):
+        """Закрыть сессию"""
+        if self._session is None:
+            return
+        if self.client == "httpx":
+            await self._session.aclose()
+        else:
+            await self._session.close()
+    
+    async def _post(self, session, url: str, body: bytes) -> Tuple[int, int, bytes]:
+        """POST JSON выбранным клиентом: (статус, нс до заголовков ответа, тело)"""
+        async with self._slots:
+            # Таймер запускается после получения слота: ожидание очереди
+            # не входит в задержку запроса
+            start_ns = time.perf_counter_ns()
+            if self.client == "httpx":
+                async with session.stream("POST", url, content=body, headers=JSON_HEADERS, timeout=REQUEST_TIMEOUT) as response:
+                    elapsed_ns = time.perf_counter_ns() - start_ns
+                    return response.status_code, elapsed_ns, await response.aread()
             
-            try:
-                payload = {
-                    "query": query,
-                    "top_k": 5,
-                    "threshold": 0.5
-                }
-                
-                async with session.post(
-                    f"{VECTORSTORE_URL}/search",
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    end_time = time.time()
-                    processing_time = end_time - start_time
-                    
-                    if response.status == 200:
-                        data = await response.json()
-                        return {
-                            "request_id": request_id,
-                            "query": query,
-                            "status": "success",
-                            "processing_time": processing_time,
-                            "response_time": data.get("processing_time", 0),
-                            "total_results": data.get("total_results", 0),
-                            "http_status": response.status
-                        }
-                    else:
-                        return {
-                            "request_id": request_id,
-                            "query": query,
-                            "status": "error",
-                            "processing_time": processing_time,
-                            "error": f"HTTP {response.status}",
-                            "http_status": response.status
-                        }
-                        
-            except Exception as e:
-                end_time = time.time()
-                return {
-                    "request_id": request_id,
-                    "query": query,
-                    "status": "error",
-                    "processing_time": end_time - start_time,
-                    "error": str(e),
-                    "http_status": 0
-                }
+            async with session.post(url, data=body, headers=JSON_HEADERS, timeout=AIOHTTP_TIMEOUT) as response:
+                elapsed_ns = time.perf_counter_ns() - start_ns
+                return response.status, elapsed_ns, await response.read()
+    
+    async def make_request(self, session, query: str, request_id: int) -> Dict[str, Any]:
+        """Выполняет один запрос к Vector Store"""
+        if not self.client_cache:
+            return await self._post_search(session, query, request_id)
+        
+        pending = self._response_cache.get(query)
+        if pending is None:
+            # Первый запрос с этим текстом идет в сеть, остальные ждут его ответа
+            pending = self._response_cache[query] = asyncio.get_running_loop().create_future()
+            result = await self._post_search(session, query, request_id)
+            if result["status"] == "success":
+                pending.set_result(result)
+            else:
+                del self._response_cache[query]
+                pending.set_result(None)
+            return result
+        
+        cached = await pending
+        if cached is None:
+            return await self._post_search(session, query, request_id)
+        return {
+            "request_id": request_id,
+            "query": query,
+            "status": "success",
+            "processing_time_ns": 0,
+            "total_results": cached["total_results"],
+            "http_status": 200,
+            "cache_hit": True
+        }
+    
+    async def _post_search(self, session, query: str, request_id: int) -> Dict[str, Any]:
+        """Отправляет запрос поиска в Vector Store"""
+        start_ns = time.perf_counter_ns()
+        
+        # В try только сеть и разбор ответа, сборка результата - вне обработчика
+        try:
+            status, processing_time_ns, body = await self._post(session, f"{VECTORSTORE_URL}/search", self._search_payloads[query])
+            data = orjson.loads(body) if status == 200 else None
+        except Exception as e:
+            return {
+                "request_id": request_id,
+                "query": query,
+                "status": "error",
+                "processing_time_ns": time.perf_counter_ns() - start_ns,
+                "error": str(e),
+                "http_status": 0
+            }
+        
+        if data is None:
+            return {
+                "request_id": request_id,
+                "query": query,
+                "status": "error",
+                "processing_time_ns": processing_time_ns,
+                "error": f"HTTP {status}",
+                "http_status": status
+            }
+        
+        return {
+            "request_id": request_id,
+            "query": query,
+            "status": "success",
+            "processing_time_ns": processing_time_ns,
+            "response_time": data.get("processing_time", 0),
+            "total_results": data.get("total_results", 0),
+            "http_status": status
+        }
+    
+    async def _warmup(self, session, request):
+        """Прогрев: холодные соединения и пустые кэши сервиса не попадают в метрики"""
+        if self.warmup_requests <= 0:
+            return
+        
+        start_ns = time.perf_counter_ns()
+        first_success_ns: Optional[int] = None
+        
+        async def warmup_request(request_id: int, query: str):
+            nonlocal first_success_ns
+            result = await request(session, query, request_id)
+            if first_success_ns is None and result["status"] == "success":
+                first_success_ns = time.perf_counter_ns() - start_ns
+        
+        async with asyncio.TaskGroup() as tg:
+            for request_id, query in self._plan[:self.warmup_requests]:
+                tg.create_task(warmup_request(request_id, query))
+        
+        if first_success_ns is None:
+            logger.warning(f"⚠️ Прогрев: ни один из {self.warmup_requests} запросов не выполнен успешно")
+        else:
+            # Холодный старт измеряется отдельно от установившегося режима
+            logger.info(f"🔥 Прогрев: {self.warmup_requests} запросов, время до первого успешного ответа: {first_success_ns * 1e-9:.3f} сек")
     
     async def test_vectorstore_direct(self):
         """Тестирует прямые запросы к Vector Store"""
         logger.info(f"🚀 Начинаем нагрузочное тестирование Vector Store")
-        logger.info(f"📊 Всего запросов: {TOTAL_REQUESTS}")
-        logger.info(f"⚡ Одновременных запросов: {CONCURRENT_REQUESTS}")
+        logger.info(f"📊 Всего запросов: {self.total_requests}")
+        logger.info(f"⚡ Одновременных запросов: {self.concurrency}")
         
-        start_time = time.time()
+        use_eager_tasks()
         
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            
-            for i in range(TOTAL_REQUESTS):
-                query = QUERIES[i % len(QUERIES)]
-                task = self.make_request(session, query, i)
-                tasks.append(task)
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            self.results = [r for r in results if isinstance(r, dict)]
+        session = self._get_session()
+        # Прогрев идет мимо клиентского кэша и не заполняет его
+        await self._warmup(session, self._post_search)
+        
+        start_time = time.perf_counter()
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(self.make_request(session, query, request_id))
+                for request_id, query in self._plan
+            ]
+        
+        self.results = [task.result() for task in tasks]
+        
+        total_time = time.perf_counter() - start_time
         
-        total_time = time.time() - start_time
+        self.analyze_results(total_time)
+    
+    async def test_vectorstore_batch(self):
+        """Тестирует пакетные запросы к Vector Store"""
+        logger.info(f"🚀 Начинаем нагрузочное тестирование Vector Store (пакетный поиск)")
+        logger.info(f"📊 Всего запросов: {self.total_requests}")
+        logger.info(f"📦 Запросов в пакете: {self.batch_size}")
+        
+        use_eager_tasks()
+        
+        session = self._get_session()
+        # Прогрев идет мимо клиентского кэша и не заполняет его
+        await self._warmup(session, self._post_search)
+        
+        start_time = time.perf_counter()
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(self.make_batch_request(
+                    session,
+                    [query for _, query in self._plan[base_id:base_id + self.batch_size]],
+                    base_id
+                ))
+                for base_id in range(0, self.total_requests, self.batch_size)
+            ]
+        
+        self.results = [result for task in tasks for result in task.result()]
+        
+        total_time = time.perf_counter() - start_time
         
         self.analyze_results(total_time)
     
+    async def make_batch_request(self, session, queries: List[str], base_id: int) -> List[Dict[str, Any]]:
+        """Выполняет пакет запросов к Vector Store одним вызовом"""
+        start_ns = time.perf_counter_ns()
+        
+        try:
+            status, processing_time_ns, body = await self._post(session, f"{VECTORSTORE_URL}/search-batch", orjson.dumps({"queries": queries, "top_k": 5, "threshold": 0.5}))
+            data = orjson.loads(body) if status == 200 else None
+        except Exception as e:
+            processing_time_ns = time.perf_counter_ns() - start_ns
+            data = None
+            error = str(e)
+            http_status = 0
+        else:
+            error = f"HTTP {status}"
+            http_status = status
+        
+        items = data.get("results", []) if data is not None else []
+        if data is not None and len(items) < len(queries):
+            # Запросы без результата в ответе считаются неуспешными, а не
+            # отбрасываются: иначе процент успеха завышается
+            error = f"Нет результата в ответе пакета ({len(items)} из {len(queries)})"
+        
+        # Время пакета приписывается каждому запросу в нем
+        results = [
+            {
+                "request_id": base_id + offset,
+                "query": query,
+                "status": "success",
+                "processing_time_ns": processing_time_ns,
+                "response_time": data.get("processing_time", 0),
+                "total_results": item.get("total_results", 0),
+                "http_status": status,
+                "batch_size": len(queries)
+            }
+            for offset, (query, item) in enumerate(zip(queries, items))
+        ]
+        
+        results.extend(
+            {
+                "request_id": base_id + offset,
+                "query": queries[offset],
+                "status": "error",
+                "processing_time_ns": processing_time_ns,
+                "error": error,
+                "http_status": http_status,
+                "batch_size": len(queries)
+            }
+            for offset in range(len(results), len(queries))
+        )
+        return results
+    
     async def test_request_processor(self):
         """Тестирует запросы через Request Processor"""
         logger.info(f"🚀 Начинаем нагрузочное тестирование Request Processor")
-        logger.info(f"📊 Всего запросов: {TOTAL_REQUESTS}")
-        logger.info(f"⚡ Одновременных запросов: {CONCURRENT_REQUESTS}")
+        logger.info(f"📊 Всего запросов: {self.total_requests}")
+        logger.info(f"⚡ Одновременных запросов: {self.concurrency}")
         
-        start_time = time.time()
+        use_eager_tasks()
         
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            
-            for i in range(TOTAL_REQUESTS):
-                query = QUERIES[i % len(QUERIES)]
-                task = self.make_request_processor(session, query, i)
-                tasks.append(task)
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            self.results = [r for r in results if isinstance(r, dict)]
+        session = self._get_session()
+        # Прогрев идет мимо клиентского кэша и не заполняет его
+        await self._warmup(session, self.make_request_processor)
+        
+        start_time = time.perf_counter()
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(self.make_request_processor(session, query, request_id))
+                for request_id, query in self._plan
+            ]
         
-        total_time = time.time() - start_time
+        self.results = [task.result() for task in tasks]
+        
+        total_time = time.perf_counter() - start_time
         
         self.analyze_results(total_time)
     
-    async def make_request_processor(self, session: aiohttp.ClientSession, query: str, request_id: int) -> Dict[str, Any]:
+    async def make_request_processor(self, session, query: str, request_id: int) -> Dict[str, Any]:
         """Выполняет запрос через Request Processor"""
-        async with self.semaphore:
-            start_time = time.time()
-            
-            try:
-                payload = {
-                    "query": query,
-                    "user_id": f"load_test_user_{request_id}",
-                    "services": ["vectorstore"]
-                }
-                
-                async with session.post(
-                    f"{REQUEST_PROCESSOR_URL}/process",
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    end_time = time.time()
-                    processing_time = end_time - start_time
-                    
-                    if response.status == 200:
-                        data = await response.json()
-                        vectorstore_result = data.get("results", {}).get("vectorstore", {})
-                        return {
-                            "request_id": request_id,
-                            "query": query,
-                            "status": "success",
-                            "processing_time": processing_time,
-                            "response_time": data.get("processing_time", 0),
-                            "vectorstore_time": vectorstore_result.get("processing_time", 0),
-                            "total_results": vectorstore_result.get("total_results", 0),
-                            "http_status": response.status
-                        }
-                    else:
-                        return {
-                            "request_id": request_id,
-                            "query": query,
-                            "status": "error",
-                            "processing_time": processing_time,
-                            "error": f"HTTP {response.status}",
-                            "http_status": response.status
-                        }
-                        
-            except Exception as e:
-                end_time = time.time()
-                return {
-                    "request_id": request_id,
-                    "query": query,
-                    "status": "error",
-                    "processing_time": end_time - start_time,
-                    "error": str(e),
-                    "http_status": 0
-                }
+        start_ns = time.perf_counter_ns()
+        
+        # user_id уникален для каждого запроса, остальная часть тела общая
+        payload = {**self._process_templates[query], "user_id": f"load_test_user_{request_id}"}
+        
+        try:
+            status, processing_time_ns, body = await self._post(session, f"{REQUEST_PROCESSOR_URL}/process", orjson.dumps(payload))
+            data = orjson.loads(body) if status == 200 else None
+        except Exception as e:
+            return {
+                "request_id": request_id,
+                "query": query,
+                "status": "error",
+                "processing_time_ns": time.perf_counter_ns() - start_ns,
+                "error": str(e),
+                "http_status": 0
+            }
+        
+        if data is None:
+            return {
+                "request_id": request_id,
+                "query": query,
+                "status": "error",
+                "processing_time_ns": processing_time_ns,
+                "error": f"HTTP {status}",
+                "http_status": status
+            }
+        
+        vectorstore_result = data.get("results", {}).get("vectorstore", {})
+        return {
+            "request_id": request_id,
+            "query": query,
+            "status": "success",
+            "processing_time_ns": processing_time_ns,
+            "response_time": data.get("processing_time", 0),
+            "vectorstore_time": vectorstore_result.get("processing_time", 0),
+            "total_results": vectorstore_result.get("total_results", 0),
+            "http_status": status
+        }
     
     def analyze_results(self, total_time: float):
         """Анализирует результаты тестирования"""
-        successful_requests = [r for r in self.results if r["status"] == "success"]
-        failed_requests = [r for r in self.results if r["status"] == "error"]
+        # Один проход по результатам: разбиение и все накопители сразу
+        successful_requests = []
+        failed_requests = []
+        processing_times_ns = []
+        response_times_list = []
+        total_results = 0
+        cache_hits = 0
+        for r in self.results:
+            if r["status"] != "success":
+                failed_requests.append(r)
+                continue
+            successful_requests.append(r)
+            total_results += r.get("total_results", 0)
+            if r.get("cache_hit"):
+                # Ответы из клиентского кэша не попадают в метрики задержки
+                cache_hits += 1
+                continue
+            processing_times_ns.append(r["processing_time_ns"])
+            response_times_list.append(r.get("response_time", 0))
         
         if not successful_requests:
             logger.error("❌ Нет успешных запросов!")
             return
         
-        processing_times = [r["processing_time"] for r in successful_requests]
-        response_times = [r.get("response_time", 0) for r in successful_requests]
+        # Один массив на метрику: все статистики считаются векторно.
+        # Время запросов хранится в целых наносекундах, в секунды переводится один раз
+        processing_times = np.array(processing_times_ns, dtype=np.int64) * 1e-9
+        response_times = np.array(response_times_list, dtype=np.float64)
+        count = len(processing_times)
+        p50, p95, p99 = np.percentile(processing_times, [50, 95, 99])
         
         total_requests = len(self.results)
         success_rate = len(successful_requests) / total_requests * 100
@@ -215,25 +448,28 @@ class LoadTester:
         logger.info(f"❌ Неудачных запросов: {len(failed_requests)}")
         logger.info(f"📊 Успешность: {success_rate:.1f}%")
         logger.info(f"⚡ Запросов в секунду: {requests_per_second:.1f}")
+        if self.client_cache:
+            logger.info(f"💾 Ответов из клиентского кэша: {cache_hits} ({cache_hits / total_requests * 100:.1f}%)")
         
         logger.info("\n📈 ВРЕМЕННЫЕ МЕТРИКИ (общее время запроса):")
-        logger.info(f"   Среднее: {statistics.mean(processing_times):.3f} сек")
-        logger.info(f"   Медиана: {statistics.median(processing_times):.3f} сек")
-        logger.info(f"   Минимум: {min(processing_times):.3f} сек")
-        logger.info(f"   Максимум: {max(processing_times):.3f} сек")
-        logger.info(f"   Стандартное отклонение: {statistics.stdev(processing_times):.3f} сек")
+        logger.info(f"   Среднее: {processing_times.mean():.3f} сек")
+        logger.info(f"   Медиана: {p50:.3f} сек")
+        logger.info(f"   p95: {p95:.3f} сек")
+        logger.info(f"   p99: {p99:.3f} сек")
+        logger.info(f"   Минимум: {processing_times.min():.3f} сек")
+        logger.info(f"   Максимум: {processing_times.max():.3f} сек")
+        logger.info(f"   Стандартное отклонение: {processing_times.std(ddof=1) if count > 1 else 0.0:.3f} сек")
         
-        if any(response_times):
+        if response_times.any():
             logger.info("\n📈 ВРЕМЕННЫЕ МЕТРИКИ (время обработки сервиса):")
-            response_times_filtered = [t for t in response_times if t > 0]
-            if response_times_filtered:
-                logger.info(f"   Среднее: {statistics.mean(response_times_filtered):.3f} сек")
-                logger.info(f"   Медиана: {statistics.median(response_times_filtered):.3f} сек")
-                logger.info(f"   Минимум: {min(response_times_filtered):.3f} сек")
-                logger.info(f"   Максимум: {max(response_times_filtered):.3f} сек")
-        
-        total_results = sum(r.get("total_results", 0) for r in successful_requests)
-        avg_results = total_results / len(successful_requests) if successful_requests else 0
+            response_times_filtered = response_times[response_times > 0]
+            if response_times_filtered.size:
+                logger.info(f"   Среднее: {response_times_filtered.mean():.3f} сек")
+                logger.info(f"   Медиана: {np.median(response_times_filtered):.3f} сек")
+                logger.info(f"   Минимум: {response_times_filtered.min():.3f} сек")
+                logger.info(f"   Максимум: {response_times_filtered.max():.3f} сек")
+        
+        avg_results = total_results / len(successful_requests)
         logger.info(f"\n🔍 РЕЗУЛЬТАТЫ ПОИСКА:")
         logger.info(f"   Всего найденных документов: {total_results}")
         logger.info(f"   Среднее документов на запрос: {avg_results:.1f}")
@@ -250,22 +486,67 @@ class LoadTester:
         
         logger.info("=" * 60)
 
+# Режим тестирования -> метод LoadTester
+TEST_MODES = {
+    "vectorstore": "test_vectorstore_direct",
+    "request_processor": "test_request_processor",
+    "batch": "test_vectorstore_batch",
+}
+
+def parse_args() -> argparse.Namespace:
+    """Разобрать аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование Vector Store")
+    parser.add_argument("--mode", choices=tuple(TEST_MODES), default="vectorstore",
+                        help="тип тестирования")
+    parser.add_argument("--requests", type=int, default=TOTAL_REQUESTS,
+                        help="всего запросов")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENT_REQUESTS,
+                        help="максимум одновременных запросов")
+    parser.add_argument("--warmup", type=int, default=WARMUP_REQUESTS,
+                        help="запросов прогрева, не входящих в результаты")
+    parser.add_argument("--batch-size", type=int, default=SEARCH_BATCH_SIZE,
+                        help="запросов в одном вызове /search-batch")
+    parser.add_argument("--client", choices=("aiohttp", "httpx"), default="aiohttp",
+                        help="HTTP-клиент для запросов")
+    parser.add_argument("--client-cache", action="store_true",
+                        help="отвечать на повторные запросы к Vector Store из клиентского кэша")
+    parser.add_argument("--profile", metavar="OUTPUT",
+                        help="снять профиль клиента cProfile и сохранить в файл")
+    return parser.parse_args()
+
 async def main():
     """Основная функция"""
-    tester = LoadTester()
+    args = parse_args()
+    tester = LoadTester(
+        client_cache=args.client_cache,
+        client=args.client,
+        total_requests=args.requests,
+        concurrency=args.concurrency,
+        warmup_requests=args.warmup,
+        batch_size=args.batch_size
+    )
     
-    print("Выберите тип тестирования:")
-    print("1. Прямые запросы к Vector Store")
-    print("2. Запросы через Request Processor")
-    
-    choice = input("Введите номер (1 или 2): ").strip()
-    
-    if choice == "1":
-        await tester.test_vectorstore_direct()
-    elif choice == "2":
-        await tester.test_request_processor()
-    else:
-        print("Неверный выбор!")
+    try:
+        if args.profile:
+            # Профилируется весь поток event loop, включая разбор ответов и статистику
+            with cProfile.Profile() as profiler:
+                await getattr(tester, TEST_MODES[args.mode])()
+            pstats.Stats(profiler).sort_stats("cumulative").dump_stats(args.profile)
+            logger.info(f"🔬 Профиль клиента сохранен в {args.profile}")
+        else:
+            await getattr(tester, TEST_MODES[args.mode])()
+    finally:
+        await tester.close()
+
+def install_uvloop():
+    """Использовать uvloop, если он установлен"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    # Цикл на libuv дешевле обрабатывает тысячи одновременных соединений
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 if __name__ == "__main__":
+    install_uvloop()
     asyncio.run(main())
@@ -3,11 +3,14 @@
 Тестирует 100 запросов для быстрой проверки
 """
 
+import argparse
 import asyncio
 import aiohttp
+import itertools
+import orjson
 import time
-import statistics
-from typing import List, Dict, Any
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +19,7 @@ logger = logging.getLogger(__name__)
 VECTORSTORE_URL = "http://localhost:8002"
 REQUEST_PROCESSOR_URL = "http://localhost:8004"
 TOTAL_REQUESTS = 100
+WARMUP_REQUESTS = 10  # Запросов прогрева, не входят в результаты
 CONCURRENT_REQUESTS = 20  # Максимум одновременных запросов
 QUERIES = [
     "музыка",
@@ -25,62 +29,184 @@ QUERIES = [
     "документ"
 ]
 
+# Тело запроса кодируется orjson сразу в bytes, заголовок задается явно
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Таймаут создается один раз, а не на каждый запрос
+REQUEST_TIMEOUT = 10
+AIOHTTP_TIMEOUT = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+def use_eager_tasks():
+    """Запускать задачи сразу при создании (Python 3.12+)"""
+    # Синхронная часть запроса выполняется без прохода через очередь event loop,
+    # и накладные расходы клиента не попадают в измеренную задержку
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
 class QuickLoadTester:
-    def __init__(self):
+    def __init__(self, client_cache: bool = False, client: str = "aiohttp"):
         self.results: List[Dict[str, Any]] = []
-        self.semaphore = asyncio.Semaphore(CONCURRENT_REQUESTS)
+        # HTTP-клиент: aiohttp или httpx для сравнения
+        self.client = client
+        # Кэш ответов по тексту запроса: повторы не уходят в сеть. Выключен
+        # по умолчанию, иначе тест измерял бы клиента, а не Vector Store
+        self.client_cache = client_cache
+        self._response_cache: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Все задачи прогона стартуют сразу: лишние ждут слот здесь, а не
+        # в пуле соединений, где ожидание попадало бы в таймаут и задержку
+        self._slots = asyncio.Semaphore(CONCURRENT_REQUESTS)
+        # Тело поиска зависит только от запроса: кодируем один раз на запрос
+        self._search_payloads = {
+            query: orjson.dumps({"query": query, "top_k": 5, "threshold": 0.5})
+            for query in QUERIES
+        }
+        # План прогона (номер запроса, текст) строится один раз и переиспользуется
+        self._plan: List[Tuple[int, str]] = list(zip(
+            range(TOTAL_REQUESTS),
+            itertools.islice(itertools.cycle(QUERIES), TOTAL_REQUESTS)
+        ))
     
-    async def make_request(self, session: aiohttp.ClientSession, query: str, request_id: int) -> Dict[str, Any]:
-        """Выполняет один запрос к Vector Store"""
-        async with self.semaphore:
-            start_time = time.time()
+    def _get_session(self):
+        """Общая сессия: пул соединений переживает последовательные прогоны"""
+        if self.client == "httpx":
+            if self._session is None or self._session.is_closed:
+                import httpx
+                self._session = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=CONCURRENT_REQUESTS,
+                        max_keepalive_connections=CONCURRENT_REQUESTS,
+                        keepalive_expiry=60
+                    )
+                )
+            return self._session
+        
+        if self._session is None or self._session.closed:
+            # Пул по размеру семафора: запрос со слотом сразу получает соединение
+            connector = aiohttp.TCPConnector(
+                limit=CONCURRENT_REQUESTS,
+                limit_per_host=CONCURRENT_REQUESTS,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+                enable_cleanup_closed=True
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+    
+    async def close(self):
+        """Закрыть сессию"""
+        if self._session is None:
+            return
+        if self.client == "httpx":
+            await self._session.aclose()
+        else:
+            await self._session.close()
+    
+    async def _post(self, session, url: str, body: bytes) -> Tuple[int, int, bytes]:
+        """POST JSON выбранным клиентом: (статус, нс до заголовков ответа, тело)"""
+        async with self._slots:
+            # Таймер запускается после получения слота: ожидание очереди
+            # не входит в задержку запроса
+            start_ns = time.perf_counter_ns()
+            if self.client == "httpx":
+                async with session.stream("POST", url, content=body, headers=JSON_HEADERS, timeout=REQUEST_TIMEOUT) as response:
+                    elapsed_ns = time.perf_counter_ns() - start_ns
+                    return response.status_code, elapsed_ns, await response.aread()
             
-            try:
-                payload = {
-                    "query": query,
-                    "top_k": 5,
-                    "threshold": 0.5
-                }
-                
-                async with session.post(
-                    f"{VECTORSTORE_URL}/search",
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    end_time = time.time()
-                    processing_time = end_time - start_time
-                    
-                    if response.status == 200:
-                        data = await response.json()
-                        return {
-                            "request_id": request_id,
-                            "query": query,
-                            "status": "success",
-                            "processing_time": processing_time,
-                            "response_time": data.get("processing_time", 0),
-                            "total_results": data.get("total_results", 0),
-                            "http_status": response.status
-                        }
-                    else:
-                        return {
-                            "request_id": request_id,
-                            "query": query,
-                            "status": "error",
-                            "processing_time": processing_time,
-                            "error": f"HTTP {response.status}",
-                            "http_status": response.status
-                        }
-                        
-            except Exception as e:
-                end_time = time.time()
-                return {
-                    "request_id": request_id,
-                    "query": query,
-                    "status": "error",
-                    "processing_time": end_time - start_time,
-                    "error": str(e),
-                    "http_status": 0
-                }
+            async with session.post(url, data=body, headers=JSON_HEADERS, timeout=AIOHTTP_TIMEOUT) as response:
+                elapsed_ns = time.perf_counter_ns() - start_ns
+                return response.status, elapsed_ns, await response.read()
+    
+    async def make_request(self, session, query: str, request_id: int) -> Dict[str, Any]:
+        """Выполняет один запрос к Vector Store"""
+        if not self.client_cache:
+            return await self._post_search(session, query, request_id)
+        
+        pending = self._response_cache.get(query)
+        if pending is None:
+            # Первый запрос с этим текстом идет в сеть, остальные ждут его ответа
+            pending = self._response_cache[query] = asyncio.get_running_loop().create_future()
+            result = await self._post_search(session, query, request_id)
+            if result["status"] == "success":
+                pending.set_result(result)
+            else:
+                del self._response_cache[query]
+                pending.set_result(None)
+            return result
+        
+        cached = await pending
+        if cached is None:
+            return await self._post_search(session, query, request_id)
+        return {
+            "request_id": request_id,
+            "query": query,
+            "status": "success",
+            "processing_time_ns": 0,
+            "total_results": cached["total_results"],
+            "http_status": 200,
+            "cache_hit": True
+        }
+    
+    async def _post_search(self, session, query: str, request_id: int) -> Dict[str, Any]:
+        """Отправляет запрос поиска в Vector Store"""
+        start_ns = time.perf_counter_ns()
+        
+        # В try только сеть и разбор ответа, сборка результата - вне обработчика
+        try:
+            status, processing_time_ns, body = await self._post(session, f"{VECTORSTORE_URL}/search", self._search_payloads[query])
+            data = orjson.loads(body) if status == 200 else None
+        except Exception as e:
+            return {
+                "request_id": request_id,
+                "query": query,
+                "status": "error",
+                "processing_time_ns": time.perf_counter_ns() - start_ns,
+                "error": str(e),
+                "http_status": 0
+            }
+        
+        if data is None:
+            return {
+                "request_id": request_id,
+                "query": query,
+                "status": "error",
+                "processing_time_ns": processing_time_ns,
+                "error": f"HTTP {status}",
+                "http_status": status
+            }
+        
+        return {
+            "request_id": request_id,
+            "query": query,
+            "status": "success",
+            "processing_time_ns": processing_time_ns,
+            "response_time": data.get("processing_time", 0),
+            "total_results": data.get("total_results", 0),
+            "http_status": status
+        }
+    
+    async def _warmup(self, session, request):
+        """Прогрев: холодные соединения и пустые кэши сервиса не попадают в метрики"""
+        if WARMUP_REQUESTS <= 0:
+            return
+        
+        start_ns = time.perf_counter_ns()
+        first_success_ns: Optional[int] = None
+        
+        async def warmup_request(request_id: int, query: str):
+            nonlocal first_success_ns
+            result = await request(session, query, request_id)
+            if first_success_ns is None and result["status"] == "success":
+                first_success_ns = time.perf_counter_ns() - start_ns
+        
+        async with asyncio.TaskGroup() as tg:
+            for request_id, query in self._plan[:WARMUP_REQUESTS]:
+                tg.create_task(warmup_request(request_id, query))
+        
+        if first_success_ns is None:
+            logger.warning(f"⚠️ Прогрев: ни один из {WARMUP_REQUESTS} запросов не выполнен успешно")
+        else:
+            # Холодный старт измеряется отдельно от установившегося режима
+            logger.info(f"🔥 Прогрев: {WARMUP_REQUESTS} запросов, время до первого успешного ответа: {first_success_ns * 1e-9:.3f} сек")
     
     async def test_vectorstore_direct(self):
         """Тестирует прямые запросы к Vector Store"""
@@ -88,35 +214,56 @@ class QuickLoadTester:
         logger.info(f"📊 Всего запросов: {TOTAL_REQUESTS}")
         logger.info(f"⚡ Одновременных запросов: {CONCURRENT_REQUESTS}")
         
-        start_time = time.time()
+        use_eager_tasks()
         
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            
-            for i in range(TOTAL_REQUESTS):
-                query = QUERIES[i % len(QUERIES)]
-                task = self.make_request(session, query, i)
-                tasks.append(task)
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            self.results = [r for r in results if isinstance(r, dict)]
+        session = self._get_session()
+        # Прогрев идет мимо клиентского кэша и не заполняет его
+        await self._warmup(session, self._post_search)
+        
+        start_time = time.perf_counter()
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(self.make_request(session, query, request_id))
+                for request_id, query in self._plan
+            ]
+        
+        self.results = [task.result() for task in tasks]
         
-        total_time = time.time() - start_time
+        total_time = time.perf_counter() - start_time
         
         self.analyze_results(total_time)
     
     def analyze_results(self, total_time: float):
         """Анализирует результаты тестирования"""
-        successful_requests = [r for r in self.results if r["status"] == "success"]
-        failed_requests = [r for r in self.results if r["status"] == "error"]
+        # Один проход по результатам: разбиение и все накопители сразу
+        successful_requests = []
+        failed_requests = []
+        processing_times_ns = []
+        response_times_list = []
+        total_results = 0
+        cache_hits = 0
+        for r in self.results:
+            if r["status"] != "success":
+                failed_requests.append(r)
+                continue
+            successful_requests.append(r)
+            total_results += r.get("total_results", 0)
+            if r.get("cache_hit"):
+                # Ответы из клиентского кэша не попадают в метрики задержки
+                cache_hits += 1
+                continue
+            processing_times_ns.append(r["processing_time_ns"])
+            response_times_list.append(r.get("response_time", 0))
         
         if not successful_requests:
             logger.error("❌ Нет успешных запросов!")
             return
         
-        processing_times = [r["processing_time"] for r in successful_requests]
-        response_times = [r.get("response_time", 0) for r in successful_requests]
+        # Один массив на метрику: все статистики считаются векторно.
+        # Время запросов хранится в целых наносекундах, в секунды переводится один раз
+        processing_times = np.array(processing_times_ns, dtype=np.int64) * 1e-9
+        response_times = np.array(response_times_list, dtype=np.float64)
+        p50, p95, p99 = np.percentile(processing_times, [50, 95, 99])
         
         total_requests = len(self.results)
         success_rate = len(successful_requests) / total_requests * 100
@@ -131,32 +278,58 @@ class QuickLoadTester:
         logger.info(f"❌ Неудачных запросов: {len(failed_requests)}")
         logger.info(f"📊 Успешность: {success_rate:.1f}%")
         logger.info(f"⚡ Запросов в секунду: {requests_per_second:.1f}")
+        if self.client_cache:
+            logger.info(f"💾 Ответов из клиентского кэша: {cache_hits} ({cache_hits / total_requests * 100:.1f}%)")
         
         logger.info("\n📈 ВРЕМЕННЫЕ МЕТРИКИ:")
-        logger.info(f"   Среднее время запроса: {statistics.mean(processing_times):.3f} сек")
-        logger.info(f"   Медиана: {statistics.median(processing_times):.3f} сек")
-        logger.info(f"   Минимум: {min(processing_times):.3f} сек")
-        logger.info(f"   Максимум: {max(processing_times):.3f} сек")
-        
-        if any(response_times):
-            response_times_filtered = [t for t in response_times if t > 0]
-            if response_times_filtered:
+        logger.info(f"   Среднее время запроса: {processing_times.mean():.3f} сек")
+        logger.info(f"   Медиана: {p50:.3f} сек")
+        logger.info(f"   p95: {p95:.3f} сек")
+        logger.info(f"   p99: {p99:.3f} сек")
+        logger.info(f"   Минимум: {processing_times.min():.3f} сек")
+        logger.info(f"   Максимум: {processing_times.max():.3f} сек")
+        
+        if response_times.any():
+            response_times_filtered = response_times[response_times > 0]
+            if response_times_filtered.size:
                 logger.info(f"\n📈 Время обработки сервиса:")
-                logger.info(f"   Среднее: {statistics.mean(response_times_filtered):.3f} сек")
-                logger.info(f"   Медиана: {statistics.median(response_times_filtered):.3f} сек")
+                logger.info(f"   Среднее: {response_times_filtered.mean():.3f} сек")
+                logger.info(f"   Медиана: {np.median(response_times_filtered):.3f} сек")
         
-        total_results = sum(r.get("total_results", 0) for r in successful_requests)
-        avg_results = total_results / len(successful_requests) if successful_requests else 0
+        avg_results = total_results / len(successful_requests)
         logger.info(f"\n🔍 РЕЗУЛЬТАТЫ ПОИСКА:")
         logger.info(f"   Всего найденных документов: {total_results}")
         logger.info(f"   Среднее документов на запрос: {avg_results:.1f}")
         
         logger.info("=" * 50)
 
+def parse_args() -> argparse.Namespace:
+    """Разобрать аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Быстрый тест производительности Vector Store")
+    parser.add_argument("--client", choices=("aiohttp", "httpx"), default="aiohttp",
+                        help="HTTP-клиент для запросов")
+    parser.add_argument("--client-cache", action="store_true",
+                        help="отвечать на повторные запросы из клиентского кэша")
+    return parser.parse_args()
+
 async def main():
     """Основная функция"""
-    tester = QuickLoadTester()
-    await tester.test_vectorstore_direct()
+    args = parse_args()
+    tester = QuickLoadTester(client_cache=args.client_cache, client=args.client)
+    try:
+        await tester.test_vectorstore_direct()
+    finally:
+        await tester.close()
+
+def install_uvloop():
+    """Использовать uvloop, если он установлен"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    # Цикл на libuv дешевле обрабатывает тысячи одновременных соединений
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 if __name__ == "__main__":
+    install_uvloop()
     asyncio.run(main())
@@ -3,17 +3,17 @@ AI Model Service API - полностью независимый микросе
 """
 import asyncio
 import logging
+import queue
 import time
-import multiprocessing
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import os
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
 import torch
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Response
+from pydantic import BaseModel, TypeAdapter
 import psutil
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -22,10 +22,17 @@ from domain.services.model_service import ModelService
 from infrastructure.persistence.optimized_model_repository import OptimizedModelRepository
 from application.use_cases.generate_text import GenerateTextUseCase, GenerateTextRequest
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Записи пишутся в очередь, а вывод выполняет отдельный поток QueueListener,
+# чтобы форматирование и I/O логов не блокировали event loop и потоки генерации
+log_queue: queue.Queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, log_handler, respect_handler_level=True)
+log_listener.start()
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(QueueHandler(log_queue))
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="AI Model Service", version="2.0.0")
@@ -33,11 +40,22 @@ app = FastAPI(title="AI Model Service", version="2.0.0")
 model_service: Optional[ModelService] = None
 generate_text_use_case: Optional[GenerateTextUseCase] = None
 
-thread_pool: Optional[ThreadPoolExecutor] = None
-process_pool: Optional[ProcessPoolExecutor] = None
+# Метрики обновляются фоновой задачей, а не на каждом запросе: чтение
+# /proc через psutil не попадает в горячий путь /generate и /health
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "1"))
+metrics_task: Optional[asyncio.Task] = None
+cached_memory_usage: Optional[Dict[str, Any]] = None
+cached_queue_depth: int = 0
 
-MAX_WORKERS = int(os.getenv("MAX_WORKERS", "8"))
-MAX_PROCESSES = int(os.getenv("MAX_PROCESSES", "2"))
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "8"))
+GENERATION_BATCH_WAIT_MS = float(os.getenv("GENERATION_BATCH_WAIT_MS", "10"))
+# Объем кэша KV-состояний общего RAG-контекста, 0 - кэш выключен
+PREFIX_CACHE_MB = int(os.getenv("PREFIX_CACHE_MB", "256"))
+# Общий таймаут генерации всех запросов /generate-batch
+GENERATION_BATCH_TIMEOUT = float(os.getenv("GENERATION_BATCH_TIMEOUT", "60"))
+MODEL_NAME = os.getenv("MODEL_NAME", "qwen-model_full")
+# Загрузка и прогрев модели при старте вместо первого пользовательского запроса
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "false").lower() == "true"
 
 
 class ModelRequest(BaseModel):
@@ -61,6 +79,9 @@ class ModelResponse(BaseModel):
     memory_usage: Optional[Dict[str, Any]] = None
 
 
+batch_response_adapter = TypeAdapter(List[ModelResponse])
+
+
 class ModelInfo(BaseModel):
     """Информация о модели"""
     model_id: str
@@ -77,33 +98,62 @@ class SystemInfo(BaseModel):
     memory_total: float
     memory_available: float
     memory_percent: float
-    thread_pool_workers: int
-    process_pool_workers: int
     loaded_models_count: int
 
 
+def _refresh_metrics() -> None:
+    """Обновить закэшированные метрики сервиса"""
+    global cached_memory_usage, cached_queue_depth
+    
+    cached_memory_usage = model_service.get_memory_usage()
+    cached_queue_depth = model_service.get_queue_depth()
+
+
+async def _metrics_loop() -> None:
+    """Периодически обновлять метрики сервиса"""
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        try:
+            _refresh_metrics()
+        except Exception as e:
+            logger.error(f"Ошибка обновления метрик: {e}")
+
+
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске"""
-    global model_service, generate_text_use_case, thread_pool, process_pool
+    global model_service, generate_text_use_case, metrics_task
     
     try:
         logger.info("🚀 Инициализация AI Model Service...")
         
+        # Intra-op потоки torch задаются один раз: их использует поток генерации,
+        # а ядра generate отпускают GIL, и отдельные процессы не нужны
         cpu_threads = int(os.getenv("CPU_THREADS", str(os.cpu_count() or 1)))
         try:
             torch.set_num_threads(cpu_threads)
         except Exception:
             pass
 
-        model_repository = OptimizedModelRepository()
+        model_repository = OptimizedModelRepository(
+            max_batch_size=GENERATION_BATCH_SIZE,
+            max_batch_wait=GENERATION_BATCH_WAIT_MS / 1000,
+            prefix_cache_mb=PREFIX_CACHE_MB
+        )
         
         model_service = ModelService(model_repository)
         
         generate_text_use_case = GenerateTextUseCase(model_service)
         
-        thread_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
-        process_pool = ProcessPoolExecutor(max_workers=MAX_PROCESSES)
+        if MODEL_WARMUP:
+            try:
+                await model_service.warmup(MODEL_NAME)
+            except Exception as e:
+                # Модель будет загружена при первом запросе
+                logger.warning(f"⚠️ Не удалось прогреть модель {MODEL_NAME}: {e}")
+        
+        _refresh_metrics()
+        metrics_task = asyncio.create_task(_metrics_loop())
         
         logger.info("✅ AI Model Service готов к работе")
         
@@ -115,21 +165,21 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при завершении"""
-    global thread_pool, process_pool
-    
     try:
         logger.info("🛑 Завершение работы AI Model Service...")
         
-        if thread_pool:
-            thread_pool.shutdown(wait=True)
+        if metrics_task:
+            metrics_task.cancel()
         
-        if process_pool:
-            process_pool.shutdown(wait=True)
+        if model_service:
+            await model_service.close()
         
         logger.info("✅ AI Model Service завершен")
         
     except Exception as e:
         logger.error(f"❌ Ошибка завершения AI Model Service: {e}")
+    finally:
+        log_listener.stop()
 
 
 @app.get("/health")
@@ -146,7 +196,8 @@ async def health_check():
             "service": "ai-model",
             "timestamp": datetime.now().isoformat(),
             "loaded_models_count": len(loaded_models),
-            "memory_usage": model_service.get_memory_usage()
+            "memory_usage": cached_memory_usage,
+            "queue_depth": cached_queue_depth
         }
         
     except Exception as e:
@@ -165,8 +216,6 @@ async def get_system_info():
             memory_total=memory.total / 1024 / 1024 / 1024,  # GB
             memory_available=memory.available / 1024 / 1024 / 1024,  # GB
             memory_percent=memory.percent,
-            thread_pool_workers=MAX_WORKERS,
-            process_pool_workers=MAX_PROCESSES,
             loaded_models_count=len(model_service.get_loaded_models()) if model_service else 0
         )
         
@@ -218,6 +267,32 @@ async def unload_model(model_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _generate(request: ModelRequest) -> ModelResponse:
+    """Выполнить генерацию для одного запроса"""
+    use_case_request = GenerateTextRequest(
+        query=request.query,
+        context=request.context,
+        max_length=request.max_length,
+        temperature=request.temperature,
+        model_id=request.model_id
+    )
+    
+    response = await generate_text_use_case.execute(use_case_request)
+    
+    # Поля заполняет сервис, повторная валидация не нужна: model_construct
+    # и готовый JSON обходят валидацию ответа в FastAPI, response_model
+    # остается для схемы OpenAPI
+    return ModelResponse.model_construct(
+        success=response.success,
+        result=response.result,
+        processing_time=response.processing_time,
+        timestamp=datetime.now().isoformat(),
+        model_id=response.model_id,
+        error=response.error,
+        memory_usage=cached_memory_usage
+    )
+
+
 @app.post("/generate", response_model=ModelResponse)
 async def generate_response(request: ModelRequest):
     """Генерировать ответ с помощью модели"""
@@ -225,32 +300,40 @@ async def generate_response(request: ModelRequest):
         if generate_text_use_case is None:
             raise HTTPException(status_code=503, detail="Service not initialized")
         
-        logger.info(f"Генерируем ответ для модели: {request.model_id}")
+        logger.info("Генерируем ответ для модели: %s", request.model_id)
         
-        use_case_request = GenerateTextRequest(
-            query=request.query,
-            context=request.context,
-            max_length=request.max_length,
-            temperature=request.temperature,
-            model_id=request.model_id
-        )
+        model_response = await _generate(request)
+        return Response(content=model_response.model_dump_json(), media_type="application/json")
         
-        response = await generate_text_use_case.execute(use_case_request)
+    except Exception as e:
+        logger.error(f"Ошибка генерации ответа: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/generate-batch", response_model=List[ModelResponse])
+async def generate_batch_responses(requests: List[ModelRequest]):
+    """Генерировать ответы для нескольких запросов"""
+    try:
+        if generate_text_use_case is None:
+            raise HTTPException(status_code=503, detail="Service not initialized")
         
-        memory_usage = model_service.get_memory_usage() if model_service else None
+        logger.info("Генерируем ответы для пакета из %d запросов", len(requests))
         
-        return ModelResponse(
-            success=response.success,
-            result=response.result,
-            processing_time=response.processing_time,
-            timestamp=datetime.now().isoformat(),
-            model_id=response.model_id,
-            error=response.error,
-            memory_usage=memory_usage
+        # Все запросы сразу попадают в очередь пакетной генерации и
+        # объединяются в общие вызовы generate; таймаут - на весь пакет
+        model_responses = await asyncio.wait_for(
+            asyncio.gather(*(_generate(request) for request in requests)),
+            timeout=GENERATION_BATCH_TIMEOUT
         )
+        return Response(content=batch_response_adapter.dump_json(model_responses), media_type="application/json")
         
+    except asyncio.TimeoutError:
+        logger.error(f"Таймаут генерации пакета из {len(requests)} запросов")
+        raise HTTPException(status_code=504, detail="Batch generation timed out")
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Ошибка генерации ответа: {e}")
+        logger.error(f"Ошибка генерации пакета ответов: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -332,4 +415,11 @@ async def get_memory_usage():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8003)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8003,
+        loop="uvloop",
+        http="httptools",
+        access_log=False
+    )
@@ -41,13 +41,15 @@ class GenerateTextUseCase:
             if not self.model_service.is_model_available(request.model_id):
                 await self.model_service.load_model(request.model_id)
             
+            prefix = self._build_prefix(request.context or [])
             prompt = self._build_prompt(request.query, request.context or [])
             
             result = await self.model_service.generate_text(
                 model_id=request.model_id,
                 prompt=prompt,
                 max_length=request.max_length,
-                temperature=request.temperature
+                temperature=request.temperature,
+                prefix=prefix
             )
             
             processing_time = time.time() - start_time
@@ -69,10 +71,17 @@ class GenerateTextUseCase:
                 error=str(e)
             )
     
+    def _build_prefix(self, context: List[str]) -> str:
+        """Построить начало промпта с контекстом, общее для запросов с тем же контекстом"""
+        if not context:
+            return ""
+        
+        context_text = "\n".join(context)
+        return f"Контекст:\n{context_text}\n\n"
+    
     def _build_prompt(self, query: str, context: List[str]) -> str:
         """Построить промпт с контекстом"""
         if not context:
             return query
         
-        context_text = "\n".join(context)
-        return f"Контекст:\n{context_text}\n\nЗапрос: {query}\n\nОтвет:"
+        return f"{self._build_prefix(context)}Запрос: {query}\n\nОтвет:"
@@ -3,17 +3,33 @@
 """
 import os
 import logging
+import shutil
+from pathlib import Path
 from typing import Dict, Any, Optional, Tuple
 from abc import ABC, abstractmethod
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
 
 from ..entities.model import Model
 from ..strategies.device_strategy import DeviceStrategyFactory, DeviceStrategy
 
 logger = logging.getLogger(__name__)
 
+# Компиляция графа модели: долгий первый запуск, но меньше накладных
+# расходов Python и запусков ядер на каждый токен
+MODEL_COMPILE = os.getenv("MODEL_COMPILE", "false").lower() == "true"
+
+# Квантизация весов: none, 8bit или 4bit (NF4). На CUDA - через bitsandbytes,
+# на CPU поддерживается 8bit - динамическая INT8-квантизация линейных слоев
+MODEL_QUANTIZATION = os.getenv("MODEL_QUANTIZATION", "none").lower()
+
+MODELS_BASE_PATH = Path("/app/models")
+
+# Копия загруженных весов без квантизации, например в tmpfs или emptyDir с
+# medium: Memory. Повторный старт собирает модель по конфигурации и читает
+# веса одним файлом safetensors, минуя from_pretrained. Пусто - кэш выключен
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "")
+
 
 class ModelFactory(ABC):
     """Абстрактная фабрика для создания моделей"""
@@ -38,9 +54,8 @@ class OptimizedModelFactory(ModelFactory):
     
     def _setup_model_paths(self) -> Dict[str, str]:
         """Настройка путей к моделям"""
-        base_path = "/app/models"
         return {
-            "qwen-model_full": os.path.join(base_path, "qwen-model_full"),
+            "qwen-model_full": str(MODELS_BASE_PATH / "qwen-model_full"),
         }
     
     def create_model(self, model_id: str, config: Dict[str, Any] = None) -> Tuple[Any, Any]:
@@ -50,33 +65,163 @@ class OptimizedModelFactory(ModelFactory):
                 raise ValueError(f"Модель {model_id} не найдена в конфигурации")
             
             model_path = self.model_paths[model_id]
-            if not os.path.exists(model_path):
+            if not Path(model_path).is_dir():
                 raise ValueError(f"Путь к модели не существует: {model_path}")
             
             device = self.device_strategy.select_device(model_id, config)
             
             logger.info(f"Создаем модель {model_id} на устройстве {device}")
             
+            # transformers импортируется только при загрузке модели: модуль auto
+            # тянет сотни подмодулей и заметно замедляет старт процесса
+            from transformers import AutoTokenizer, AutoModelForCausalLM
+            
+            quantization_config = self._get_quantization_config() if device == "cuda" else None
+            quantize_cpu = device == "cpu" and self._use_cpu_quantization()
+            
+            # Квантизованные модели не кэшируются: динамически квантизованные
+            # слои и веса bitsandbytes не восстанавливаются из state_dict
+            cache_path = None
+            if quantization_config is None and not quantize_cpu:
+                cache_path = self._get_cache_path(model_id, device)
+            
             tokenizer = AutoTokenizer.from_pretrained(model_path)
             
-            model = AutoModelForCausalLM.from_pretrained(
-                model_path,
-                torch_dtype=torch.float32,
-                device_map=device,
-                low_cpu_mem_usage=True
-            )
+            if cache_path is not None and (cache_path / "model.safetensors").is_file():
+                logger.info(f"Загружаем веса модели {model_id} из кэша {cache_path}")
+                model = self._load_from_cache(cache_path, device)
+            elif quantization_config is not None:
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_path,
+                    quantization_config=quantization_config,
+                    torch_dtype=torch.float16,
+                    device_map=device,
+                    low_cpu_mem_usage=True
+                )
+            else:
+                # Веса сразу грузятся в целевом типе: float16 на GPU, на CPU - тип
+                # чекпойнта (обычно bfloat16) без приведения к float32. Динамическая
+                # квантизация принимает только float32
+                if device == "cuda":
+                    torch_dtype = torch.float16
+                elif quantize_cpu:
+                    torch_dtype = torch.float32
+                else:
+                    torch_dtype = "auto"
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_path,
+                    torch_dtype=torch_dtype,
+                    device_map=device,
+                    low_cpu_mem_usage=True
+                )
+                if cache_path is not None:
+                    self._save_to_cache(model, cache_path)
+            
+            if quantize_cpu:
+                # Веса Linear хранятся в int8, активации квантуются на лету: в 4 раза
+                # меньше памяти и трафика, на CPU с VNNI умножения идут в int8
+                model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                logger.info("Применена динамическая INT8-квантизация линейных слоев")
             
             if device == "cuda":
-                model = model.half()  # Используем float16 для экономии памяти
                 torch.cuda.empty_cache()
+                
+                if MODEL_COMPILE:
+                    # Статический KV-кэш фиксирует формы тензоров, что позволяет
+                    # захватить шаг декодирования в CUDA graph
+                    model.generation_config.cache_implementation = "static"
+                    model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+            elif MODEL_COMPILE and not quantize_cpu:
+                # На CPU CUDA graph нет: компилируем с динамическими формами, чтобы
+                # разная длина промптов и пакетов не вызывала перекомпиляцию
+                model.forward = torch.compile(model.forward, dynamic=True)
+            
+            model.eval()
             
-            logger.info(f"Модель {model_id} успешно создана на {device}")
+            logger.info(f"Модель {model_id} успешно создана на {device}, тип весов {next(model.parameters()).dtype}")
             return tokenizer, model
             
         except Exception as e:
             logger.error(f"Ошибка создания модели {model_id}: {e}")
             raise
     
+    def _get_quantization_config(self) -> Optional[Any]:
+        """Получить конфигурацию квантизации bitsandbytes"""
+        if MODEL_QUANTIZATION not in ("4bit", "8bit"):
+            return None
+        
+        try:
+            import bitsandbytes  # noqa: F401
+            from transformers import BitsAndBytesConfig
+        except ImportError:
+            logger.warning("bitsandbytes не установлен, модель загружается без квантизации")
+            return None
+        
+        logger.info(f"Используем квантизацию весов {MODEL_QUANTIZATION}")
+        if MODEL_QUANTIZATION == "8bit":
+            return BitsAndBytesConfig(load_in_8bit=True)
+        return BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.float16
+        )
+    
+    @staticmethod
+    def _use_cpu_quantization() -> bool:
+        """Проверить, нужна ли INT8-квантизация модели на CPU"""
+        if MODEL_QUANTIZATION == "4bit":
+            logger.warning("4bit квантизация на CPU не поддерживается, используем 8bit")
+        return MODEL_QUANTIZATION in ("4bit", "8bit")
+    
+    @staticmethod
+    def _get_cache_path(model_id: str, device: str) -> Optional[Path]:
+        """Путь к кэшу весов модели; тип весов зависит от устройства"""
+        if not MODEL_CACHE_DIR:
+            return None
+        return Path(MODEL_CACHE_DIR) / f"{model_id}-{device}"
+    
+    @staticmethod
+    def _save_to_cache(model: Any, cache_path: Path) -> None:
+        """Сохранить конфигурацию и веса загруженной модели в кэш"""
+        from safetensors.torch import save_model
+        
+        # Запись во временный каталог и переименование: прерванное сохранение
+        # не оставит неполный кэш, который загрузится при следующем старте
+        tmp_path = cache_path.with_name(f"{cache_path.name}.tmp")
+        try:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            tmp_path.mkdir(parents=True)
+            model.config.save_pretrained(tmp_path)
+            model.generation_config.save_pretrained(tmp_path)
+            save_model(model, str(tmp_path / "model.safetensors"))
+            tmp_path.rename(cache_path)
+            logger.info(f"Веса модели сохранены в кэш {cache_path}")
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить модель в кэш {cache_path}: {e}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    
+    @staticmethod
+    def _load_from_cache(cache_path: Path, device: str) -> Any:
+        """Собрать модель по конфигурации и загрузить веса из кэша"""
+        from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+        from safetensors.torch import load_model
+        try:
+            from transformers.modeling_utils import no_init_weights
+        except ImportError:
+            # transformers 5.x
+            from transformers.initialization import no_init_weights
+        
+        config = AutoConfig.from_pretrained(cache_path)
+        # Модель создается сразу на устройстве и в типе кэша, без случайной
+        # инициализации: все веса перезаписываются из файла
+        with no_init_weights(), torch.device(device):
+            model = AutoModelForCausalLM.from_config(config, torch_dtype=config.torch_dtype)
+        # Общие веса (например, lm_head и эмбеддинги) хранятся в файле один раз
+        model.tie_weights()
+        load_model(model, cache_path / "model.safetensors", device=device)
+        model.generation_config = GenerationConfig.from_pretrained(cache_path)
+        return model
+    
     def create_model_entity(self, model_id: str, device: str, path: str) -> Model:
         """Создать доменную сущность модели"""
         from datetime import datetime
@@ -106,7 +251,8 @@ class OptimizedModelFactory(ModelFactory):
     
     def validate_model(self, model_id: str) -> bool:
         """Проверить валидность модели"""
-        return model_id in self.model_paths and os.path.exists(self.model_paths[model_id])
+        # Чекпойнт - каталог: файл по этому пути from_pretrained не загрузит
+        return model_id in self.model_paths and Path(self.model_paths[model_id]).is_dir()
 
 
 class ModelFactoryRegistry:
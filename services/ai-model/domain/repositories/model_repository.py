@@ -49,6 +49,11 @@ class ModelRepository(ABC):
         """Получить информацию об использовании памяти"""
         pass
     
+    @abstractmethod
+    def get_queue_depth(self) -> int:
+        """Получить число запросов генерации в очереди"""
+        pass
+    
     @abstractmethod
     def optimize_memory(self) -> None:
         """Оптимизировать использование памяти"""
@@ -58,3 +63,13 @@ class ModelRepository(ABC):
     def get_model_info(self, model_id: str) -> Optional[Dict[str, Any]]:
         """Получить информацию о модели"""
         pass
+    
+    @abstractmethod
+    async def warmup(self, model_id: str) -> None:
+        """Загрузить и прогреть модель"""
+        pass
+    
+    @abstractmethod
+    async def close(self) -> None:
+        """Освободить ресурсы репозитория"""
+        pass
@@ -0,0 +1,51 @@
+"""
+Кэш KV-состояний общих префиксов промптов для AI Model Service
+"""
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+class KVCacheStore:
+    """LRU кэш KV-состояний префиксов, ограниченный объемом в байтах"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[bytes, Tuple[Any, int]]" = OrderedDict()
+        self._size_bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        """Текущий объем кэша"""
+        return self._size_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: bytes) -> Optional[Any]:
+        """Получить состояние префикса и отметить его как недавно использованное"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: bytes, value: Any, nbytes: int) -> None:
+        """Сохранить состояние префикса, вытесняя самые старые записи"""
+        if nbytes > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size_bytes -= previous[1]
+
+        self._entries[key] = (value, nbytes)
+        self._size_bytes += nbytes
+
+        while self._size_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self._size_bytes -= evicted_bytes
+
+    def clear(self) -> None:
+        """Очистить кэш"""
+        self._entries.clear()
+        self._size_bytes = 0
@@ -0,0 +1,102 @@
+"""
+Микро-батчинг конкурентных запросов для AI Model Service
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Собирает конкурентные запросы в пакет и обрабатывает их одним вызовом"""
+
+    def __init__(self,
+                 handler: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch_size: int = 32,
+                 max_wait: float = 0.005):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Число запросов, ожидающих в очереди или обрабатываемых"""
+        return self._pending
+
+    async def submit(self, item: Any) -> Any:
+        """Поставить элемент в очередь и дождаться его результата"""
+        if self._worker is None or self._worker.done():
+            self._start()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        # Счетчик меняется только в потоке event loop, блокировка не нужна
+        self._pending += 1
+        try:
+            return await future
+        finally:
+            self._pending -= 1
+
+    def _start(self):
+        """Запустить фоновый обработчик очереди"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """Цикл сборки и обработки пакетов"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._process(batch)
+
+    async def _process(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """Обработать пакет и раздать результаты ожидающим"""
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Ошибка обработки пакета из {len(batch)} запросов: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Остановить обработчик и отменить ожидающие запросы"""
+        if self._worker is None:
+            return
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+        self._worker = None
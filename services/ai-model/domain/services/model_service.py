@@ -33,6 +33,10 @@ class ModelService:
         """Получить информацию об использовании памяти"""
         return self.model_repository.get_memory_usage()
     
+    def get_queue_depth(self) -> int:
+        """Получить число запросов генерации в очереди"""
+        return self.model_repository.get_queue_depth()
+    
     def optimize_memory(self) -> None:
         """Оптимизировать память"""
         self.model_repository.optimize_memory()
@@ -42,9 +46,18 @@ class ModelService:
         model = self.model_repository.find_by_id(model_id)
         return model is not None and model.is_available()
     
-    async def generate_text(self, model_id: str, prompt: str, max_length: int = 512, temperature: float = 0.7) -> str:
+    async def generate_text(self, model_id: str, prompt: str, max_length: int = 512, temperature: float = 0.7,
+                            prefix: str = "") -> str:
         """Генерировать текст с помощью модели"""
         if not self.is_model_available(model_id):
             raise ValueError(f"Модель {model_id} недоступна")
         
-        return await self.model_repository.generate_text(model_id, prompt, max_length, temperature)
+        return await self.model_repository.generate_text(model_id, prompt, max_length, temperature, prefix=prefix)
+    
+    async def warmup(self, model_id: str) -> None:
+        """Загрузить и прогреть модель"""
+        await self.model_repository.warmup(model_id)
+    
+    async def close(self) -> None:
+        """Освободить ресурсы"""
+        await self.model_repository.close()
@@ -4,7 +4,7 @@
 from abc import ABC, abstractmethod
 import torch
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +12,15 @@ logger = logging.getLogger(__name__)
 class DeviceStrategy(ABC):
     """Абстрактная стратегия выбора устройства"""
     
+    _cuda_available: Optional[bool] = None
+    
+    def cuda_available(self) -> bool:
+        """Проверить CUDA один раз за время жизни стратегии"""
+        # Проба драйвера не бесплатна, а ее результат в процессе не меняется
+        if self._cuda_available is None:
+            self._cuda_available = torch.cuda.is_available()
+        return self._cuda_available
+    
     @abstractmethod
     def select_device(self, model_id: str, config: Dict[str, Any] = None) -> str:
         """Выбрать устройство для модели"""
@@ -28,7 +37,7 @@ class AutoDeviceStrategy(DeviceStrategy):
     
     def select_device(self, model_id: str, config: Dict[str, Any] = None) -> str:
         """Автоматически выбрать лучшее доступное устройство"""
-        if torch.cuda.is_available():
+        if self.cuda_available():
             logger.info("CUDA доступен, выбираем GPU")
             return "cuda"
         else:
@@ -38,7 +47,7 @@ class AutoDeviceStrategy(DeviceStrategy):
     def is_device_available(self, device: str) -> bool:
         """Проверить доступность устройства"""
         if device == "cuda":
-            return torch.cuda.is_available()
+            return self.cuda_available()
         elif device == "cpu":
             return True
         return False
@@ -47,10 +56,14 @@ class AutoDeviceStrategy(DeviceStrategy):
 class GPUFirstStrategy(DeviceStrategy):
     """Стратегия с приоритетом GPU"""
     
+    _gpu_memory: Optional[int] = None
+    
     def select_device(self, model_id: str, config: Dict[str, Any] = None) -> str:
         """Выбрать GPU если доступен, иначе CPU"""
-        if torch.cuda.is_available():
-            gpu_memory = torch.cuda.get_device_properties(0).total_memory
+        if self.cuda_available():
+            if self._gpu_memory is None:
+                self._gpu_memory = torch.cuda.get_device_properties(0).total_memory
+            gpu_memory = self._gpu_memory
             required_memory = config.get("required_memory", 0) if config else 0
             
             if gpu_memory >= required_memory:
@@ -64,7 +77,7 @@ class GPUFirstStrategy(DeviceStrategy):
     def is_device_available(self, device: str) -> bool:
         """Проверить доступность устройства"""
         if device == "cuda":
-            return torch.cuda.is_available()
+            return self.cuda_available()
         elif device == "cpu":
             return True
         return False
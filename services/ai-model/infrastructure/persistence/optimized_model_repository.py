@@ -1,20 +1,25 @@
 """
 Оптимизированная реализация репозитория моделей для AI Model Service
 """
+import asyncio
+import copy
+import hashlib
 import os
 import logging
 import time
 import psutil
 import torch
-from typing import List, Optional, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Set, Tuple
 from datetime import datetime
 import uuid
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
 from domain.repositories.model_repository import ModelRepository
 from domain.entities.model import Model
-from domain.factories.model_factory import ModelFactoryRegistry
+from domain.factories.model_factory import ModelFactoryRegistry, MODEL_COMPILE
 from domain.strategies.threading_strategy import ThreadingManager
+from domain.services.micro_batcher import MicroBatcher
+from domain.services.kv_cache_store import KVCacheStore
 
 logger = logging.getLogger(__name__)
 
@@ -22,12 +27,36 @@ logger = logging.getLogger(__name__)
 class OptimizedModelRepository(ModelRepository):
     """Оптимизированная реализация репозитория моделей"""
     
-    def __init__(self, factory_name: str = "optimized", threading_strategy: str = "async"):
+    def __init__(self, factory_name: str = "optimized", threading_strategy: str = "async",
+                 max_batch_size: int = 8, max_batch_wait: float = 0.01, prefix_cache_mb: int = 0):
         self.models: Dict[str, Model] = {}
         self.loaded_models: Dict[str, Any] = {}  # model_id -> (tokenizer, model)
+        self.generation_kwargs: Dict[str, Dict[str, Any]] = {}  # model_id -> неизменные параметры generate
+        self._warmed_up: Set[str] = set()  # модели, уже прогнавшие прогревочную генерацию
         
         self.model_factory = ModelFactoryRegistry.get_factory(factory_name)
         self.threading_manager = ThreadingManager(threading_strategy)
+        self._load_lock = asyncio.Lock()
+        # Модель принадлежит одному потоку: пакеты выполняются по очереди и не
+        # конкурируют за веса и ядра, как параллельные generate на общем пуле
+        self._generation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generate")
+        # Конкурентные запросы генерации, пришедшие в пределах окна ожидания,
+        # выполняются одним вызовом generate
+        self._generation_batcher = MicroBatcher(
+            self._generate_batch,
+            max_batch_size=max_batch_size,
+            max_wait=max_batch_wait
+        )
+        # KV-состояния общих префиксов промптов (RAG-контекста): повторный запрос
+        # с тем же контекстом пропускает его prefill. Статический KV-кэш
+        # скомпилированной модели несовместим с переданным извне DynamicCache
+        self._prefix_cache = KVCacheStore(prefix_cache_mb * 1024 * 1024)
+        self._prefix_cache_enabled = prefix_cache_mb > 0 and not MODEL_COMPILE
+        # Закрепленный (pinned) буфер входов на CUDA: копирование на GPU идет
+        # по DMA асинхронно, без промежуточной копии в закрепленную память.
+        # Буфер переиспользуется только после завершения предыдущего копирования
+        self._pinned_inputs: Optional[torch.Tensor] = None
+        self._pinned_copy_done: Optional[Any] = None
         
         logger.info(f"Инициализирован OptimizedModelRepository с фабрикой {factory_name} и стратегией {threading_strategy}")
     
@@ -63,6 +92,18 @@ class OptimizedModelRepository(ModelRepository):
     
     async def load_model(self, model_id: str, device: str = "auto") -> Model:
         """Загрузить модель в память с использованием фабрики"""
+        # Загруженная модель отдается без блокировки; под блокировкой проверка
+        # повторяется, чтобы конкурентные первые запросы не грузили модель дважды
+        if model_id in self.loaded_models:
+            return self.models[model_id]
+        
+        async with self._load_lock:
+            if model_id in self.loaded_models:
+                return self.models[model_id]
+            return await self._load_model_locked(model_id, device)
+    
+    async def _load_model_locked(self, model_id: str, device: str) -> Model:
+        """Загрузить модель, вызывается под блокировкой загрузки"""
         try:
             logger.info(f"Загружаем модель: {model_id}")
             
@@ -79,12 +120,22 @@ class OptimizedModelRepository(ModelRepository):
                 config
             )
             
+            # Для пакетной генерации декодеру нужен паддинг слева
+            tokenizer.padding_side = "left"
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            self.generation_kwargs[model_id] = self._build_generation_kwargs(tokenizer)
             self.loaded_models[model_id] = (tokenizer, model)
             
             model_path = self.model_factory.model_paths[model_id]
             model_entity = self.model_factory.create_model_entity(model_id, model.device, model_path)
             self.models[model_id] = model_entity
             
+            if MODEL_COMPILE:
+                # Граф компилируется при первом вызове: платим за это при загрузке,
+                # а не на первом пользовательском запросе
+                await self._run_warmup(model_id)
+            
             logger.info(f"Модель {model_id} успешно загружена на {model.device}")
             return self.models[model_id]
             
@@ -100,6 +151,10 @@ class OptimizedModelRepository(ModelRepository):
                 del tokenizer
                 del model
                 del self.loaded_models[model_id]
+                self.generation_kwargs.pop(model_id, None)
+                self._warmed_up.discard(model_id)
+                # Кэш принадлежит потоку генерации: очищаем его в той же очереди
+                self._generation_executor.submit(self._prefix_cache.clear)
                 
                 if model_id in self.models:
                     self.models[model_id].unload()
@@ -111,8 +166,48 @@ class OptimizedModelRepository(ModelRepository):
             logger.error(f"Ошибка выгрузки модели {model_id}: {e}")
             return False
     
+    @staticmethod
+    def _build_generation_kwargs(tokenizer) -> Dict[str, Any]:
+        """Собрать параметры generate, не зависящие от запроса"""
+        return {
+            "max_new_tokens": 10,
+            "do_sample": True,
+            "pad_token_id": tokenizer.eos_token_id,
+            "eos_token_id": tokenizer.eos_token_id,
+            "num_beams": 1,
+            "repetition_penalty": 1.0,
+            "use_cache": True
+        }
+    
+    def _to_device(self, inputs: Any, device: torch.device) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Перенести input_ids и attention_mask на устройство модели"""
+        if device.type != "cuda":
+            return inputs.input_ids.to(device), inputs.attention_mask.to(device)
+        
+        rows, cols = inputs.input_ids.shape
+        numel = 2 * rows * cols
+        if self._pinned_copy_done is not None:
+            self._pinned_copy_done.synchronize()
+        if self._pinned_inputs is None or self._pinned_inputs.numel() < numel:
+            self._pinned_inputs = torch.empty(numel, dtype=torch.long, pin_memory=True)
+        
+        # Непрерывный срез буфера: несмежный тензор копировался бы через
+        # временную обычную память
+        host = self._pinned_inputs[:numel].view(2, rows, cols)
+        host[0].copy_(inputs.input_ids)
+        host[1].copy_(inputs.attention_mask)
+        device_inputs = host.to(device, non_blocking=True)
+        
+        self._pinned_copy_done = torch.cuda.Event()
+        self._pinned_copy_done.record()
+        return device_inputs[0], device_inputs[1]
+    
     def _generate_text_sync(self, model_id: str, prompt: str, max_length: int = 512, temperature: float = 0.7) -> str:
         """Генерировать текст с помощью модели"""
+        return self._generate_batch_sync(model_id, [prompt], max_length, temperature)[0]
+    
+    def _generate_batch_sync(self, model_id: str, prompts: List[str], max_length: int = 512, temperature: float = 0.7) -> List[str]:
+        """Генерировать тексты для пакета промптов одним вызовом generate"""
         if model_id not in self.loaded_models:
             raise ValueError(f"Модель {model_id} не загружена")
         
@@ -120,44 +215,167 @@ class OptimizedModelRepository(ModelRepository):
             tokenizer, model = self.loaded_models[model_id]
             
             inputs = tokenizer(
-                prompt, 
+                prompts, 
                 return_tensors="pt", 
                 padding=True, 
                 truncation=True, 
                 max_length=max_length
             )
+            input_ids, attention_mask = self._to_device(inputs, model.device)
             
             with torch.no_grad():
                 outputs = model.generate(
-                    inputs.input_ids,
-                    attention_mask=inputs.attention_mask,
-                    max_new_tokens=10,
-                    do_sample=True,
+                    input_ids,
+                    attention_mask=attention_mask,
                     temperature=temperature,
-                    pad_token_id=tokenizer.eos_token_id,
-                    num_beams=1,
-                    repetition_penalty=1.0,
-                    use_cache=True,
-                    eos_token_id=tokenizer.eos_token_id,
-                    early_stopping=True
+                    **self.generation_kwargs[model_id]
                 )
             
-            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            return generated_text
+            # Декодируем только сгенерированные токены, без повторного декодирования промптов
+            prompt_length = input_ids.shape[1]
+            return tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
             
         except Exception as e:
             logger.error(f"Ошибка генерации текста: {e}")
             raise
     
-    async def generate_text(self, model_id: str, prompt: str, max_length: int = 512, temperature: float = 0.7) -> str:
-        return await self.threading_manager.execute_task(
-            self._generate_text_sync,
-            model_id,
-            prompt,
-            max_length,
-            temperature
-        )
+    def _generate_with_prefix_sync(self, model_id: str, prompt: str, prefix: str,
+                                   max_length: int = 512, temperature: float = 0.7) -> str:
+        """Генерировать текст, переиспользуя KV-состояние общего префикса промпта"""
+        from transformers import DynamicCache
+        
+        if model_id not in self.loaded_models:
+            raise ValueError(f"Модель {model_id} не загружена")
+        
+        tokenizer, model = self.loaded_models[model_id]
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=max_length)
+        prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids
+        prefix_length = prefix_ids.shape[1]
+        
+        # Префикс должен совпасть с началом промпта токен в токен и оставить
+        # хотя бы один токен для generate, иначе кэш неприменим
+        if (prefix_length >= inputs.input_ids.shape[1]
+                or not torch.equal(inputs.input_ids[0, :prefix_length], prefix_ids[0])):
+            return self._generate_batch_sync(model_id, [prompt], max_length, temperature)[0]
+        
+        key = hashlib.blake2b(model_id.encode() + prefix_ids.numpy().tobytes(), digest_size=16).digest()
+        prefix_cache = self._prefix_cache.get(key)
+        
+        with torch.no_grad():
+            if prefix_cache is None:
+                prefix_cache = model(
+                    prefix_ids.to(model.device),
+                    past_key_values=DynamicCache(),
+                    use_cache=True
+                ).past_key_values
+                self._prefix_cache.put(key, prefix_cache, self._kv_cache_bytes(model, prefix_length))
+            
+            # generate дописывает кэш, поэтому ему передается копия
+            input_ids, attention_mask = self._to_device(inputs, model.device)
+            outputs = model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                past_key_values=copy.deepcopy(prefix_cache),
+                temperature=temperature,
+                **self.generation_kwargs[model_id]
+            )
+        
+        return tokenizer.decode(outputs[0, inputs.input_ids.shape[1]:], skip_special_tokens=True)
+    
+    @staticmethod
+    def _kv_cache_bytes(model, num_tokens: int) -> int:
+        """Оценить объем KV-кэша для заданного числа токенов"""
+        config = model.config
+        num_heads = config.num_attention_heads
+        num_kv_heads = getattr(config, "num_key_value_heads", None) or num_heads
+        head_dim = getattr(config, "head_dim", None) or config.hidden_size // num_heads
+        element_size = torch.finfo(model.dtype).bits // 8
+        return 2 * config.num_hidden_layers * num_kv_heads * head_dim * num_tokens * element_size
+    
+    async def _generate_batch(self, items: List[Tuple[str, str, int, float, str]]) -> List[str]:
+        """Обработать пакет запросов генерации из очереди"""
+        # В один вызов generate попадают только запросы с одинаковыми параметрами
+        groups: Dict[Tuple[str, int, float], List[int]] = {}
+        for i, (model_id, _, max_length, temperature, _) in enumerate(items):
+            groups.setdefault((model_id, max_length, temperature), []).append(i)
+        
+        results: List[Any] = [None] * len(items)
+        loop = asyncio.get_running_loop()
+        
+        for (model_id, max_length, temperature), positions in groups.items():
+            try:
+                prefix = items[positions[0]][4]
+                if len(positions) == 1 and prefix and self._prefix_cache_enabled:
+                    # Одиночный запрос с контекстом: prefill контекста берется из кэша.
+                    # Пакет из нескольких запросов уже делит проход по весам
+                    text = await loop.run_in_executor(
+                        self._generation_executor,
+                        self._generate_with_prefix_sync,
+                        model_id,
+                        items[positions[0]][1],
+                        prefix,
+                        max_length,
+                        temperature
+                    )
+                    texts = [text]
+                else:
+                    texts = await loop.run_in_executor(
+                        self._generation_executor,
+                        self._generate_batch_sync,
+                        model_id,
+                        [items[i][1] for i in positions],
+                        max_length,
+                        temperature
+                    )
+            except Exception as e:
+                texts = [e] * len(positions)
+            for i, text in zip(positions, texts):
+                results[i] = text
+        
+        return results
+    
+    async def generate_text(self, model_id: str, prompt: str, max_length: int = 512, temperature: float = 0.7,
+                            prefix: str = "") -> str:
+        """Генерировать текст через общий пакет конкурентных запросов"""
+        result = await self._generation_batcher.submit((model_id, prompt, max_length, temperature, prefix))
+        if isinstance(result, Exception):
+            raise result
+        return result
+    
+    def _warmup_sync(self, model_id: str) -> None:
+        """Прогнать короткую генерацию, чтобы инициализировать ядра и кэши"""
+        tokenizer, model = self.loaded_models[model_id]
+        inputs = tokenizer("Привет", return_tensors="pt")
+        input_ids, attention_mask = self._to_device(inputs, model.device)
+        
+        with torch.no_grad():
+            model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                # Два токена: prefill и один шаг декодирования с KV-кэшем
+                **{**self.generation_kwargs[model_id], "max_new_tokens": 2}
+            )
+    
+    async def warmup(self, model_id: str) -> None:
+        """Загрузить модель и выполнить прогревочную генерацию"""
+        await self.load_model(model_id)
+        
+        # Скомпилированная модель прогревается уже при загрузке
+        if model_id not in self._warmed_up:
+            await self._run_warmup(model_id)
+    
+    async def _run_warmup(self, model_id: str) -> None:
+        """Выполнить прогревочную генерацию в потоке генерации"""
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._generation_executor, self._warmup_sync, model_id)
+        self._warmed_up.add(model_id)
+        logger.info(f"Модель {model_id} прогрета за {time.time() - start_time:.2f}с")
+    
+    async def close(self) -> None:
+        """Остановить пакетную генерацию"""
+        await self._generation_batcher.close()
+        self._generation_executor.shutdown(wait=False)
 
     def get_memory_usage(self) -> Dict[str, Any]:
         """Получить информацию об использовании памяти"""
@@ -168,9 +386,15 @@ class OptimizedModelRepository(ModelRepository):
             "rss_mb": memory_info.rss / 1024 / 1024,
             "vms_mb": memory_info.vms / 1024 / 1024,
             "percent": process.memory_percent(),
-            "loaded_models_count": len(self.loaded_models)
+            "loaded_models_count": len(self.loaded_models),
+            "prefix_cache_mb": self._prefix_cache.size_bytes / 1024 / 1024,
+            "prefix_cache_entries": len(self._prefix_cache)
         }
     
+    def get_queue_depth(self) -> int:
+        """Получить число запросов генерации в очереди и в обработке"""
+        return self._generation_batcher.pending
+    
     def optimize_memory(self) -> None:
         """Оптимизировать использование памяти"""
         try:
@@ -5,6 +5,7 @@ import pytest
 import asyncio
 import torch
 from unittest.mock import Mock, patch
+from pathlib import Path
 from typing import Dict, Any
 
 from domain.factories.model_factory import ModelFactoryRegistry, OptimizedModelFactory
@@ -51,6 +52,15 @@ class TestDeviceStrategies:
             device = strategy.select_device("test_model", {"required_memory": 8 * 1024**3})
             assert device == "cpu"
     
+    def test_cuda_probe_is_memoized(self):
+        """Тест однократной проверки CUDA стратегией"""
+        with patch('torch.cuda.is_available', return_value=False) as mock_available:
+            strategy = AutoDeviceStrategy()
+            assert strategy.select_device("test_model") == "cpu"
+            assert strategy.select_device("test_model") == "cpu"
+            assert not strategy.is_device_available("cuda")
+            assert mock_available.call_count == 1
+    
     def test_cpu_only_strategy(self):
         """Тест CPU-только стратегии"""
         strategy = CPUOnlyStrategy()
@@ -120,9 +130,72 @@ class TestModelFactories:
         
         assert not factory.validate_model("non_existent_model")
         
-        with patch('os.path.exists', return_value=True):
+        with patch.object(Path, 'is_dir', return_value=True):
             assert factory.validate_model("qwen-model_full")
     
+    def test_cpu_model_keeps_checkpoint_dtype(self):
+        """Тест загрузки модели на CPU без приведения к float32"""
+        factory = OptimizedModelFactory(device_strategy=CPUOnlyStrategy())
+        model = Mock()
+        model.parameters.return_value = iter([torch.zeros(1, dtype=torch.bfloat16)])
+        
+        with patch('domain.factories.model_factory.Path'), \
+             patch('transformers.AutoTokenizer.from_pretrained'), \
+             patch('transformers.AutoModelForCausalLM.from_pretrained', return_value=model) as from_pretrained:
+            factory.create_model("qwen-model_full")
+        
+        assert from_pretrained.call_args.kwargs["torch_dtype"] == "auto"
+        model.half.assert_not_called()
+    
+    def test_cpu_model_int8_quantization(self):
+        """Тест динамической INT8-квантизации модели на CPU"""
+        factory = OptimizedModelFactory(device_strategy=CPUOnlyStrategy())
+        quantized = Mock()
+        quantized.parameters.return_value = iter([torch.zeros(1)])
+        
+        with patch('domain.factories.model_factory.MODEL_QUANTIZATION', "8bit"), \
+             patch('domain.factories.model_factory.Path'), \
+             patch('transformers.AutoTokenizer.from_pretrained'), \
+             patch('transformers.AutoModelForCausalLM.from_pretrained') as from_pretrained, \
+             patch('torch.ao.quantization.quantize_dynamic', return_value=quantized) as quantize_dynamic:
+            _, model = factory.create_model("qwen-model_full")
+        
+        assert from_pretrained.call_args.kwargs["torch_dtype"] == torch.float32
+        assert quantize_dynamic.call_args.kwargs["dtype"] == torch.qint8
+        assert model is quantized
+    
+    def test_cpu_model_warm_start_from_cache(self, tmp_path):
+        """Тест повторной загрузки модели из кэша весов"""
+        from transformers import AutoModelForCausalLM, Qwen2Config, Qwen2ForCausalLM
+        
+        checkpoint = tmp_path / "qwen-model_full"
+        config = Qwen2Config(vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=1,
+                             num_attention_heads=4, num_key_value_heads=2, tie_word_embeddings=True)
+        Qwen2ForCausalLM(config).to(torch.bfloat16).save_pretrained(checkpoint)
+        
+        from_pretrained = AutoModelForCausalLM.from_pretrained
+        
+        def load_without_device_map(path, **kwargs):
+            kwargs.pop("device_map")
+            return from_pretrained(path, **kwargs)
+        
+        factory = OptimizedModelFactory(device_strategy=CPUOnlyStrategy())
+        factory.model_paths = {"qwen-model_full": str(checkpoint)}
+        
+        with patch('domain.factories.model_factory.MODEL_CACHE_DIR', str(tmp_path / "cache")), \
+             patch('transformers.AutoTokenizer.from_pretrained'), \
+             patch('transformers.AutoModelForCausalLM.from_pretrained', side_effect=load_without_device_map) as loader:
+            _, model = factory.create_model("qwen-model_full")
+            _, cached = factory.create_model("qwen-model_full")
+        
+        assert loader.call_count == 1
+        assert (tmp_path / "cache" / "qwen-model_full-cpu" / "model.safetensors").is_file()
+        assert cached.dtype == torch.bfloat16
+        
+        input_ids = torch.tensor([[1, 2, 3]])
+        with torch.no_grad():
+            assert torch.equal(model(input_ids).logits, cached(input_ids).logits)
+    
     def test_model_factory_registry(self):
         """Тест реестра фабрик моделей"""
         custom_factory = Mock()
@@ -157,6 +230,175 @@ class TestIntegration:
         assert isinstance(repository.model_factory, OptimizedModelFactory)
         assert isinstance(repository.threading_manager.strategy, HybridThreadingStrategy)
     
+    @pytest.mark.asyncio
+    async def test_concurrent_load_model_loads_once(self):
+        """Тест однократной загрузки модели при конкурентных запросах"""
+        from infrastructure.persistence.optimized_model_repository import OptimizedModelRepository
+        
+        factory = Mock()
+        factory.validate_model.return_value = True
+        factory.get_model_config.return_value = {}
+        factory.model_paths = {"test_model": "/tmp/test_model"}
+        factory.create_model.return_value = (Mock(), Mock(device="cpu"))
+        factory.create_model_entity.side_effect = (
+            lambda model_id, device, path: OptimizedModelFactory().create_model_entity(model_id, device, path)
+        )
+        ModelFactoryRegistry.register_factory("load_once", factory)
+        
+        repository = OptimizedModelRepository(factory_name="load_once", threading_strategy="async")
+        models = await asyncio.gather(*(repository.load_model("test_model") for _ in range(5)))
+        
+        assert factory.create_model.call_count == 1
+        assert all(model is models[0] for model in models)
+        repository.threading_manager.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_compiled_model_is_warmed_up_on_load(self):
+        """Тест прогрева скомпилированной модели при загрузке"""
+        from infrastructure.persistence.optimized_model_repository import OptimizedModelRepository
+        
+        factory = Mock()
+        factory.validate_model.return_value = True
+        factory.get_model_config.return_value = {}
+        factory.model_paths = {"test_model": "/tmp/test_model"}
+        factory.create_model.return_value = (Mock(), Mock(device="cpu"))
+        factory.create_model_entity.side_effect = (
+            lambda model_id, device, path: OptimizedModelFactory().create_model_entity(model_id, device, path)
+        )
+        ModelFactoryRegistry.register_factory("compiled", factory)
+        
+        repository = OptimizedModelRepository(factory_name="compiled", threading_strategy="async")
+        with patch('infrastructure.persistence.optimized_model_repository.MODEL_COMPILE', True), \
+             patch.object(repository, "_warmup_sync") as warmup_sync:
+            await repository.load_model("test_model")
+            await repository.load_model("test_model")
+            await repository.warmup("test_model")
+        
+        warmup_sync.assert_called_once_with("test_model")
+        
+        await repository.close()
+        repository.threading_manager.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_generation_is_batched(self):
+        """Тест объединения конкурентных запросов генерации в пакет"""
+        from infrastructure.persistence.optimized_model_repository import OptimizedModelRepository
+        
+        repository = OptimizedModelRepository(threading_strategy="async", max_batch_size=8, max_batch_wait=0.05)
+        calls = []
+        
+        def fake_generate_batch(model_id, prompts, max_length, temperature):
+            calls.append((model_id, list(prompts), temperature))
+            return [f"ответ: {prompt}" for prompt in prompts]
+        
+        with patch.object(repository, "_generate_batch_sync", side_effect=fake_generate_batch):
+            results = await asyncio.gather(
+                repository.generate_text("test_model", "a", temperature=0.7),
+                repository.generate_text("test_model", "b", temperature=0.7),
+                repository.generate_text("test_model", "c", temperature=0.2)
+            )
+        
+        assert results == ["ответ: a", "ответ: b", "ответ: c"]
+        assert sorted(len(prompts) for _, prompts, _ in calls) == [1, 2]
+        
+        await repository.close()
+        repository.threading_manager.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_generation_groups_run_sequentially(self):
+        """Тест выполнения групп пакета по очереди в одном потоке"""
+        import threading
+        import time
+        from infrastructure.persistence.optimized_model_repository import OptimizedModelRepository
+        
+        repository = OptimizedModelRepository(threading_strategy="async", max_batch_size=8, max_batch_wait=0.05)
+        threads = set()
+        active = []
+        overlaps = []
+        
+        def fake_generate_batch(model_id, prompts, max_length, temperature):
+            threads.add(threading.current_thread().name)
+            overlaps.append(bool(active))
+            active.append(model_id)
+            time.sleep(0.01)
+            active.pop()
+            return list(prompts)
+        
+        with patch.object(repository, "_generate_batch_sync", side_effect=fake_generate_batch):
+            await asyncio.gather(*(
+                repository.generate_text("test_model", str(i), temperature=i / 10)
+                for i in range(4)
+            ))
+        
+        assert len(threads) == 1
+        assert not any(overlaps)
+        
+        await repository.close()
+        repository.threading_manager.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_single_request_with_context_uses_prefix_cache(self):
+        """Тест генерации одиночного запроса с контекстом через кэш префикса"""
+        from infrastructure.persistence.optimized_model_repository import OptimizedModelRepository
+        
+        repository = OptimizedModelRepository(threading_strategy="async", max_batch_wait=0.01, prefix_cache_mb=16)
+        
+        with patch.object(repository, "_generate_with_prefix_sync", return_value="ответ") as with_prefix, \
+             patch.object(repository, "_generate_batch_sync") as batch_sync:
+            result = await repository.generate_text("test_model", "Контекст:\na\n\nЗапрос: b", prefix="Контекст:\na\n\n")
+        
+        assert result == "ответ"
+        with_prefix.assert_called_once()
+        batch_sync.assert_not_called()
+        
+        await repository.close()
+        repository.threading_manager.cleanup()
+    
+    @pytest.mark.asyncio
+    async def test_queue_depth_counts_pending_requests(self):
+        """Тест подсчета запросов генерации в очереди"""
+        import threading
+        from infrastructure.persistence.optimized_model_repository import OptimizedModelRepository
+        
+        repository = OptimizedModelRepository(threading_strategy="async", max_batch_size=2, max_batch_wait=0.01)
+        release = threading.Event()
+        
+        def fake_generate_batch(model_id, prompts, max_length, temperature):
+            release.wait(5)
+            return list(prompts)
+        
+        with patch.object(repository, "_generate_batch_sync", side_effect=fake_generate_batch):
+            tasks = [asyncio.create_task(repository.generate_text("test_model", str(i))) for i in range(3)]
+            await asyncio.sleep(0.05)
+            assert repository.get_queue_depth() == 3
+            
+            release.set()
+            await asyncio.gather(*tasks)
+        
+        assert repository.get_queue_depth() == 0
+        
+        await repository.close()
+        repository.threading_manager.cleanup()
+    
+    def test_kv_cache_store_evicts_least_recently_used(self):
+        """Тест вытеснения давно неиспользованных префиксов из кэша"""
+        from domain.services.kv_cache_store import KVCacheStore
+        
+        store = KVCacheStore(max_bytes=100)
+        store.put(b"a", "a", 40)
+        store.put(b"b", "b", 40)
+        assert store.get(b"a") == "a"
+        
+        store.put(b"c", "c", 40)
+        store.put(b"huge", "huge", 200)
+        
+        assert store.get(b"b") is None
+        assert store.get(b"huge") is None
+        assert store.get(b"a") == "a"
+        assert store.get(b"c") == "c"
+        assert store.size_bytes == 80
+        assert len(store) == 2
+    
     def test_device_selection_integration(self):
         """Тест интеграции выбора устройства"""
         device_strategy = GPUFirstStrategy()
@@ -2,29 +2,46 @@
 API Gateway Service - полностью независимый микросервис
 """
 import logging
+import queue
 import time
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import os
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from domain.services.gateway_service import GatewayService
+from infrastructure.security.security_middleware import SecurityMiddleware, SecurityHeadersMiddleware
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Записи пишутся в очередь, а вывод выполняет отдельный поток QueueListener,
+# чтобы форматирование и I/O логов не блокировали event loop. Обработчики
+# подключаются при старте приложения, а не при импорте: модуль может быть
+# импортирован в процессе дважды (как __main__ и как api.main)
+log_queue: queue.Queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, log_handler, respect_handler_level=True)
+queue_handler = QueueHandler(log_queue)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="API Gateway Service", version="2.0.0")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "100"))
+LOG_SENSITIVE_DATA = os.getenv("LOG_SENSITIVE_DATA", "false").lower() == "true"
+
+# Заголовки, которые описывают исходное соединение и не должны проксироваться
+HOP_BY_HOP_HEADERS = frozenset({"host", "content-length", "connection", "transfer-encoding"})
 
-gateway_service: Optional[GatewayService] = None
+app = FastAPI(title="API Gateway Service", version="2.0.0", default_response_class=ORJSONResponse)
+app.add_middleware(SecurityHeadersMiddleware)
 
 
 class ServiceHealthResponse(BaseModel):
@@ -51,12 +68,22 @@ class GatewayResponse(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске"""
-    global gateway_service
+    log_listener.start()
+    root_logger.addHandler(queue_handler)
     
     try:
         logger.info("🚀 Инициализация API Gateway Service...")
         
-        gateway_service = GatewayService()
+        app.state.gateway_service = GatewayService()
+        
+        security_middleware = SecurityMiddleware(
+            REDIS_URL,
+            rate_limit=RATE_LIMIT_PER_MINUTE,
+            log_sensitive_data=LOG_SENSITIVE_DATA
+        )
+        await security_middleware.initialize()
+        security_middleware.start_cleanup()
+        app.state.security_middleware = security_middleware
         
         logger.info("✅ API Gateway Service готов к работе")
         
@@ -68,21 +95,43 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при завершении"""
-    global gateway_service
-    
     try:
+        gateway_service = getattr(app.state, "gateway_service", None)
         if gateway_service:
             await gateway_service.close()
+        security_middleware = getattr(app.state, "security_middleware", None)
+        if security_middleware:
+            await security_middleware.close()
         logger.info("✅ API Gateway Service завершен")
         
     except Exception as e:
         logger.error(f"❌ Ошибка завершения API Gateway Service: {e}")
+    finally:
+        root_logger.removeHandler(queue_handler)
+        log_listener.stop()
+
+
+async def get_gateway_service(request: Request) -> GatewayService:
+    """Получить сервис маршрутизации из состояния приложения"""
+    gateway_service = getattr(request.app.state, "gateway_service", None)
+    if gateway_service is None:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    return gateway_service
+
+
+async def get_security_middleware(request: Request) -> SecurityMiddleware:
+    """Получить middleware безопасности из состояния приложения"""
+    security_middleware = getattr(request.app.state, "security_middleware", None)
+    if security_middleware is None:
+        raise HTTPException(status_code=503, detail="Service not initialized")
+    return security_middleware
 
 
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Проверка здоровья API Gateway"""
     try:
+        gateway_service = getattr(request.app.state, "gateway_service", None)
         if gateway_service is None:
             return {"status": "unhealthy", "error": "Service not initialized"}
         
@@ -106,12 +155,9 @@ async def health_check():
 
 
 @app.get("/services")
-async def get_services_info():
+async def get_services_info(gateway_service: GatewayService = Depends(get_gateway_service)):
     """Получить информацию о всех сервисах"""
     try:
-        if gateway_service is None:
-            raise HTTPException(status_code=503, detail="Service not initialized")
-        
         services = gateway_service.get_all_services_info()
         
         result = {}
@@ -132,12 +178,12 @@ async def get_services_info():
 
 
 @app.get("/services/{service_name}/health")
-async def check_service_health(service_name: str):
+async def check_service_health(
+    service_name: str,
+    gateway_service: GatewayService = Depends(get_gateway_service)
+):
     """Проверить здоровье конкретного сервиса"""
     try:
-        if gateway_service is None:
-            raise HTTPException(status_code=503, detail="Service not initialized")
-        
         health_data = await gateway_service.check_service_health(service_name)
         
         return ServiceHealthResponse(**health_data)
@@ -147,29 +193,96 @@ async def check_service_health(service_name: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/statistics")
+async def get_statistics(gateway_service: GatewayService = Depends(get_gateway_service)):
+    """Получить статистику API Gateway"""
+    try:
+        services = gateway_service.get_all_services_info()
+        
+        available_services = sum(1 for s in services.values() if s.is_available)
+        total_services = len(services)
+        
+        return {
+            "total_services": total_services,
+            "available_services": available_services,
+            "unavailable_services": total_services - available_services,
+            "uptime_percentage": (available_services / total_services * 100) if total_services > 0 else 0
+        }
+        
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/")
+async def root():
+    """Корневой эндпоинт"""
+    return {
+        "service": "API Gateway",
+        "version": "2.0.0",
+        "status": "running",
+        "timestamp": datetime.now().isoformat(),
+        "endpoints": {
+            "health": "/health",
+            "services": "/services",
+            "service_health": "/services/{service_name}/health",
+            "statistics": "/statistics"
+        }
+    }
+
+
+# Универсальный маршрут регистрируется последним, иначе он перехватывает
+# собственные эндпоинты шлюза (/statistics, /)
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def route_request(request: Request, path: str):
+async def route_request(
+    request: Request,
+    path: str,
+    gateway_service: GatewayService = Depends(get_gateway_service),
+    security_middleware: SecurityMiddleware = Depends(get_security_middleware)
+):
     """Маршрутизировать запрос к соответствующему сервису"""
+    start_time = time.time()
+    
     try:
-        if gateway_service is None:
-            raise HTTPException(status_code=503, detail="Service not initialized")
-        
-        start_time = time.time()
+        client = request.client
+        client_ip = client.host if client else "unknown"
+        if not await security_middleware.check_rate_limit(client_ip):
+            logger.warning("Превышен лимит запросов для %s", client_ip)
+            return ORJSONResponse(
+                status_code=429,
+                content={"error": "Too many requests"}
+            )
         
         method = request.method
-        headers = dict(request.headers)
+        request_headers = request.headers
+        headers = {
+            name: value for name, value in request_headers.items()
+            if name not in HOP_BY_HOP_HEADERS
+        }
         body = None
         
-        if method in ["POST", "PUT"]:
+        if method == "POST" or method == "PUT":
             try:
                 body = await request.json()
             except:
                 body = {}
+            
+            query = body.get("query") if isinstance(body, dict) else None
+            if isinstance(query, str) and not security_middleware.validate_query(query):
+                logger.warning("Отклонен небезопасный запрос от %s", client_ip)
+                return ORJSONResponse(
+                    status_code=400,
+                    content={"error": "Invalid input"}
+                )
         
-        user_id = headers.get("X-User-ID")
-        session_id = headers.get("X-Session-ID")
+        user_id = request_headers.get("x-user-id")
+        session_id = request_headers.get("x-session-id")
         
-        logger.info(f"Маршрутизируем запрос {method} /{path}")
+        # Строка запроса собирается и очищается от секретов, только если запись попадет в лог
+        if logger.isEnabledFor(logging.INFO):
+            query_string = request.url.query
+            target = f"/{path}?{query_string}" if query_string else f"/{path}"
+            logger.info("Маршрутизируем запрос %s %s", method, security_middleware.sanitize_log_data(target))
         
         result = await gateway_service.route_request(
             method=method,
@@ -183,12 +296,12 @@ async def route_request(request: Request, path: str):
         processing_time = time.time() - start_time
         
         if result["success"]:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=result["status_code"],
                 content=result["body"]
             )
         else:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=500,
                 content={
                     "error": result["error"],
@@ -201,7 +314,7 @@ async def route_request(request: Request, path: str):
         processing_time = time.time() - start_time
         logger.error(f"Ошибка маршрутизации запроса: {e}")
         
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "error": str(e),
@@ -210,47 +323,20 @@ async def route_request(request: Request, path: str):
         )
 
 
-@app.get("/statistics")
-async def get_statistics():
-    """Получить статистику API Gateway"""
-    try:
-        if gateway_service is None:
-            raise HTTPException(status_code=503, detail="Service not initialized")
-        
-        services = gateway_service.get_all_services_info()
-        
-        available_services = sum(1 for s in services.values() if s.is_available)
-        total_services = len(services)
-        
-        return {
-            "total_services": total_services,
-            "available_services": available_services,
-            "unavailable_services": total_services - available_services,
-            "uptime_percentage": (available_services / total_services * 100) if total_services > 0 else 0
-        }
-        
-    except Exception as e:
-        logger.error(f"Ошибка получения статистики: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-
-@app.get("/")
-async def root():
-    """Корневой эндпоинт"""
-    return {
-        "service": "API Gateway",
-        "version": "2.0.0",
-        "status": "running",
-        "timestamp": datetime.now().isoformat(),
-        "endpoints": {
-            "health": "/health",
-            "services": "/services",
-            "service_health": "/services/{service_name}/health",
-            "statistics": "/statistics"
-        }
-    }
-
-
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Общий лимит запросов хранится в Redis, но резервные окна на случай
+    # недоступности Redis и кэш заблокированных клиентов - свои у каждого
+    # воркера: при N воркерах резервный лимит фактически в N раз выше
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    uvicorn.run(
+        # Несколько воркеров загружают приложение по строке импорта,
+        # один воркер использует уже импортированный объект
+        app if workers == 1 else "api.main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+        workers=workers
+    )
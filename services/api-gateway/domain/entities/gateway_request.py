@@ -7,7 +7,7 @@ from datetime import datetime
 import uuid
 
 
-@dataclass
+@dataclass(slots=True)
 class GatewayRequest:
     """Доменная сущность запроса к API Gateway"""
     id: str
@@ -43,7 +43,7 @@ class GatewayRequest:
         self.processing_time = processing_time
 
 
-@dataclass
+@dataclass(slots=True)
 class ServiceEndpoint:
     """Доменная сущность эндпоинта сервиса"""
     name: str
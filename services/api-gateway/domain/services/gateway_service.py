@@ -2,8 +2,10 @@
 Доменный сервис для работы с API Gateway
 """
 import logging
+import os
 import time
 import aiohttp
+from types import MappingProxyType
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -11,6 +13,15 @@ from ..entities.gateway_request import GatewayRequest, ServiceEndpoint
 
 logger = logging.getLogger(__name__)
 
+# Адреса сервисов читаются из окружения один раз при импорте
+SERVICE_URLS = MappingProxyType({
+    "ai-model": os.getenv("AI_MODEL_URL", "http://ai-model:8003"),
+    "vectorstore": os.getenv("VECTORSTORE_URL", "http://vectorstore:8002"),
+    "scraper": os.getenv("SCRAPER_URL", "http://scraper:8001"),
+    "request-processor": os.getenv("REQUEST_PROCESSOR_URL", "http://request-processor:8004"),
+    "payment": os.getenv("PAYMENT_URL", "http://payment:8005"),
+})
+
 
 class GatewayService:
     """Доменный сервис для работы с API Gateway"""
@@ -18,11 +29,7 @@ class GatewayService:
     def __init__(self):
         self.session = None
         self.services = {
-            "ai-model": ServiceEndpoint("ai-model", "http://ai-model:8003"),
-            "vectorstore": ServiceEndpoint("vectorstore", "http://vectorstore:8002"),
-            "scraper": ServiceEndpoint("scraper", "http://scraper:8001"),
-            "request-processor": ServiceEndpoint("request-processor", "http://request-processor:8004"),
-            "payment": ServiceEndpoint("payment", "http://payment:8005")
+            name: ServiceEndpoint(name, url) for name, url in SERVICE_URLS.items()
         }
     
     async def _get_session(self) -> aiohttp.ClientSession:
@@ -50,13 +57,13 @@ class GatewayService:
             if not target_service:
                 raise ValueError(f"Неизвестный путь: {path}")
             
-            if not self.services[target_service].is_available:
+            service = self.services[target_service]
+            if not service.is_available:
                 raise Exception(f"Сервис {target_service} недоступен")
             
-            service_url = self.services[target_service].url
-            target_url = f"{service_url}{path}"
+            target_url = f"{service.url}{path}"
             
-            logger.info(f"Маршрутизируем запрос {method} {path} к сервису {target_service}")
+            logger.info("Маршрутизируем запрос %s %s к сервису %s", method, path, target_service)
             
             response = await self._make_request(method, target_url, headers, body)
             
@@ -64,7 +71,7 @@ class GatewayService:
             gateway_request.set_response(response["status_code"], response["body"])
             gateway_request.set_processing_time(processing_time)
             
-            logger.info(f"Запрос {gateway_request.id} обработан за {processing_time:.3f}с")
+            logger.info("Запрос %s обработан за %.3fс", gateway_request.id, processing_time)
             
             return {
                 "success": True,
@@ -109,36 +116,14 @@ class GatewayService:
         session = await self._get_session()
         
         try:
-            if method.upper() == "GET":
-                async with session.get(url, headers=headers) as response:
-                    response_body = await response.json()
-                    return {
-                        "status_code": response.status,
-                        "body": response_body
-                    }
-            elif method.upper() == "POST":
-                async with session.post(url, headers=headers, json=body) as response:
-                    response_body = await response.json()
-                    return {
-                        "status_code": response.status,
-                        "body": response_body
-                    }
-            elif method.upper() == "PUT":
-                async with session.put(url, headers=headers, json=body) as response:
-                    response_body = await response.json()
-                    return {
-                        "status_code": response.status,
-                        "body": response_body
-                    }
-            elif method.upper() == "DELETE":
-                async with session.delete(url, headers=headers) as response:
-                    response_body = await response.json()
-                    return {
-                        "status_code": response.status,
-                        "body": response_body
-                    }
-            else:
-                raise ValueError(f"Неподдерживаемый метод: {method}")
+            # Метод уже ограничен маршрутом шлюза (GET/POST/PUT/DELETE),
+            # поэтому отдельные ветки на каждый метод не нужны
+            async with session.request(method, url, headers=headers, json=body) as response:
+                response_body = await response.json()
+                return {
+                    "status_code": response.status,
+                    "body": response_body
+                }
                 
         except Exception as e:
             logger.error(f"Ошибка выполнения запроса {method} {url}: {e}")
@@ -0,0 +1,279 @@
+"""
+Middleware безопасности API Gateway
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import NoScriptError, RedisError
+
+logger = logging.getLogger(__name__)
+
+# Скользящее окно на sorted set: за один вызов удаляем устаревшие отметки,
+# считаем оставшиеся и добавляем новую, только если лимит не превышен.
+# При отказе возвращает время (мс) до освобождения слота в окне.
+RATE_LIMIT_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, tonumber(oldest[2]) + window - now}
+"""
+
+XSS_PATTERNS = [
+    r"<script[^>]*>",
+    r"</script>",
+    r"javascript:",
+    r"vbscript:",
+    r"\bon\w+\s*=",
+    r"<iframe[^>]*>",
+    r"<object[^>]*>",
+    r"<embed[^>]*>",
+]
+
+SQLI_PATTERNS = [
+    r"\bunion\s+(?:all\s+)?select\b",
+    r"\bdrop\s+(?:table|database)\b",
+    r"\binsert\s+into\b",
+    r"\bdelete\s+from\b",
+    r"\bor\s+1\s*=\s*1\b",
+    r";\s*--",
+]
+
+# Шаблоны обеих групп объединены в одну альтернацию: запрос проверяется
+# за один проход вместо отдельного re.search на каждый шаблон или группу
+INJECTION_RE = re.compile("|".join(f"(?:{p})" for p in XSS_PATTERNS + SQLI_PATTERNS), re.IGNORECASE)
+
+# Пауза перед повторной попыткой обратиться к Redis после ошибки
+REDIS_RETRY_INTERVAL_NS = 5 * 1_000_000_000
+
+USE_HTTPS = os.getenv("USE_HTTPS", "false").lower() == "true"
+
+# Заголовки безопасности кодируются один раз при импорте
+SECURITY_HEADERS: Tuple[Tuple[bytes, bytes], ...] = (
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"x-xss-protection", b"1; mode=block"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+) + ((
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+) if USE_HTTPS else ())
+
+SENSITIVE_KEYS = [
+    "password",
+    "passwd",
+    "token",
+    "access_token",
+    "api_key",
+    "apikey",
+    "secret",
+    "authorization",
+]
+
+SENSITIVE_RE = re.compile(
+    r"\b(" + "|".join(SENSITIVE_KEYS) + r")\s*([=:])\s*[^\s&;,]+",
+    re.IGNORECASE
+)
+
+
+class SecurityMiddleware:
+    """Проверки безопасности входящих запросов"""
+
+    def __init__(self, redis_url: str, rate_limit: int = 100, window_seconds: int = 60,
+                 blocked_cache_size: int = 100_000, max_query_length: int = 1000,
+                 log_sensitive_data: bool = False):
+        self.redis = redis.from_url(redis_url)
+        self.log_sensitive_data = log_sensitive_data
+        self.rate_limit = rate_limit
+        self.max_query_length = max_query_length
+        self.window_ms = window_seconds * 1000
+        self.window_ns = window_seconds * 1_000_000_000
+        self._script_sha: Optional[str] = None
+        # Локальный кэш заблокированных клиентов: ip -> момент разблокировки (monotonic_ns)
+        self._blocked: Dict[str, int] = {}
+        self._blocked_cache_size = blocked_cache_size
+        # Локальное скользящее окно на случай недоступности Redis: ip -> отметки (monotonic_ns)
+        self._local_windows: Dict[str, Deque[int]] = {}
+        self._redis_retry_at = 0
+        self._cleanup_task: Optional[asyncio.Task] = None
+        # Будит очистку, когда после простоя появляется первая запись
+        self._cleanup_wakeup = asyncio.Event()
+
+    async def initialize(self):
+        """Загрузить Lua-скрипт лимитера в Redis"""
+        try:
+            self._script_sha = await self.redis.script_load(RATE_LIMIT_SCRIPT)
+            logger.info("✅ Скрипт rate limiting загружен в Redis")
+        except RedisError as e:
+            logger.warning(f"⚠️ Redis недоступен, скрипт будет загружен при первом запросе: {e}")
+
+    async def check_rate_limit(self, client_ip: str) -> bool:
+        """Проверить лимит запросов клиента"""
+        now = time.monotonic_ns()
+
+        blocked_until = self._blocked.get(client_ip)
+        if blocked_until is not None:
+            if blocked_until > now:
+                return False
+            del self._blocked[client_ip]
+
+        if now < self._redis_retry_at:
+            return self._check_local_rate_limit(client_ip, now)
+
+        try:
+            allowed, retry_after_ms = await self._eval_rate_limit(client_ip)
+        except RedisError as e:
+            # Не пытаемся обращаться к Redis до конца паузы, считаем лимит локально
+            logger.error("Redis недоступен для rate limiting, используем локальный лимитер: %s", e)
+            self._redis_retry_at = now + REDIS_RETRY_INTERVAL_NS
+            return self._check_local_rate_limit(client_ip, now)
+
+        if not allowed:
+            self._remember_blocked(client_ip, now + max(retry_after_ms, 0) * 1_000_000)
+        return allowed
+
+    def _check_local_rate_limit(self, client_ip: str, now: int) -> bool:
+        """Проверить лимит по локальному окну процесса"""
+        timestamps = self._local_windows.get(client_ip)
+        if timestamps is None:
+            timestamps = self._local_windows[client_ip] = deque()
+            self._cleanup_wakeup.set()
+
+        cutoff = now - self.window_ns
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
+
+        if len(timestamps) >= self.rate_limit:
+            self._remember_blocked(client_ip, timestamps[0] + self.window_ns)
+            return False
+
+        timestamps.append(now)
+        return True
+
+    def _remember_blocked(self, client_ip: str, blocked_until: int):
+        """Запомнить клиента до освобождения слота в окне"""
+        if len(self._blocked) >= self._blocked_cache_size:
+            # Вытесняем самую старую запись
+            del self._blocked[next(iter(self._blocked))]
+        self._blocked[client_ip] = blocked_until
+        self._cleanup_wakeup.set()
+
+    async def _eval_rate_limit(self, client_ip: str) -> Tuple[bool, int]:
+        """Выполнить скрипт скользящего окна: (разрешено, остаток или задержка в мс)"""
+        now_ms = int(time.time() * 1000)
+        args = (now_ms, self.window_ms, self.rate_limit, f"{now_ms}:{uuid.uuid4().hex}")
+        key = f"rate_limit:{client_ip}"
+
+        if self._script_sha is None:
+            self._script_sha = await self.redis.script_load(RATE_LIMIT_SCRIPT)
+
+        try:
+            allowed, remaining = await self.redis.evalsha(self._script_sha, 1, key, *args)
+        except NoScriptError:
+            # Redis перезапускался и потерял кэш скриптов
+            self._script_sha = await self.redis.script_load(RATE_LIMIT_SCRIPT)
+            allowed, remaining = await self.redis.evalsha(self._script_sha, 1, key, *args)
+
+        return bool(allowed), int(remaining)
+
+    def validate_query(self, query: str) -> bool:
+        """Проверить текст запроса на XSS и SQL-инъекции"""
+        if len(query) > self.max_query_length:
+            return False
+        return INJECTION_RE.search(query) is None
+
+    def sanitize_log_data(self, data: str) -> str:
+        """Скрыть секреты в строке перед записью в лог"""
+        if self.log_sensitive_data:
+            return data
+        # Без разделителей ключ=значение скрывать нечего
+        if "=" not in data and ":" not in data:
+            return data
+        return SENSITIVE_RE.sub(r"\1\2[REDACTED]", data)
+
+    def evict_idle(self) -> int:
+        """Удалить окна неактивных клиентов и истекшие блокировки"""
+        now = time.monotonic_ns()
+        cutoff = now - self.window_ns
+
+        idle = [ip for ip, timestamps in self._local_windows.items() if not timestamps or timestamps[-1] <= cutoff]
+        for ip in idle:
+            del self._local_windows[ip]
+
+        expired = [ip for ip, blocked_until in self._blocked.items() if blocked_until <= now]
+        for ip in expired:
+            del self._blocked[ip]
+
+        return len(idle) + len(expired)
+
+    def _next_expiry(self) -> Optional[int]:
+        """Ближайший момент (monotonic_ns), когда запись станет устаревшей"""
+        expiries = [timestamps[-1] + self.window_ns for timestamps in self._local_windows.values() if timestamps]
+        expiries.extend(self._blocked.values())
+        return min(expiries, default=None)
+
+    def start_cleanup(self, interval: float = 60.0):
+        """Запустить периодическую очистку локальных структур"""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop(interval))
+
+    async def _cleanup_loop(self, interval: float):
+        """Цикл очистки: спит до ближайшего истечения, но не чаще interval"""
+        while True:
+            next_expiry = self._next_expiry()
+            if next_expiry is None and not self._local_windows:
+                # Очищать нечего: ждем первой записи вместо пробуждений по таймеру
+                self._cleanup_wakeup.clear()
+                await self._cleanup_wakeup.wait()
+                continue
+
+            delay = 0.0 if next_expiry is None else (next_expiry - time.monotonic_ns()) / 1_000_000_000
+            await asyncio.sleep(max(delay, interval))
+            evicted = self.evict_idle()
+            if evicted:
+                logger.debug("Очищено %d записей rate limiting", evicted)
+
+    async def close(self):
+        """Остановить очистку и закрыть соединение с Redis"""
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+        await self.redis.aclose()
+
+
+class SecurityHeadersMiddleware:
+    """ASGI middleware, добавляющий заголовки безопасности ко всем ответам"""
+
+    def __init__(self, app, headers: Tuple[Tuple[bytes, bytes], ...] = SECURITY_HEADERS):
+        self.app = app
+        self.headers = headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).extend(self.headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -4,7 +4,7 @@ In-Memory реализация репозитория для Payment Service
 import logging
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter, defaultdict
 
 from domain.repositories.payment_repository import PaymentRepository
 from domain.entities.payment import Payment, Subscription
@@ -91,23 +91,23 @@ class InMemoryPaymentRepository(PaymentRepository):
     
     def get_statistics(self) -> Dict[str, Any]:
         """Получить статистику"""
-        total_payments = len(self.payments)
-        completed_payments = len([p for p in self.payments.values() if p.status == "completed"])
-        failed_payments = len([p for p in self.payments.values() if p.status == "failed"])
-        pending_payments = len([p for p in self.payments.values() if p.status == "pending"])
+        # Статусы и выручка считаются за один проход по платежам
+        payment_statuses = Counter()
+        total_revenue = 0
+        for payment in self.payments.values():
+            payment_statuses[payment.status] += 1
+            if payment.status == "completed":
+                total_revenue += payment.amount
         
-        total_revenue = sum([p.amount for p in self.payments.values() if p.status == "completed"])
-        
-        total_subscriptions = len(self.subscriptions)
-        active_subscriptions = len([s for s in self.subscriptions.values() if s.is_active()])
+        active_subscriptions = sum(1 for s in self.subscriptions.values() if s.is_active())
         
         return {
-            "total_payments": total_payments,
-            "completed_payments": completed_payments,
-            "failed_payments": failed_payments,
-            "pending_payments": pending_payments,
+            "total_payments": len(self.payments),
+            "completed_payments": payment_statuses["completed"],
+            "failed_payments": payment_statuses["failed"],
+            "pending_payments": payment_statuses["pending"],
             "total_revenue": total_revenue,
-            "total_subscriptions": total_subscriptions,
+            "total_subscriptions": len(self.subscriptions),
             "active_subscriptions": active_subscriptions,
             "unique_users": len(self.user_payments)
         }
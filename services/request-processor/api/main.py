@@ -22,6 +22,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+VECTOR_CACHE_SIZE = int(os.getenv("VECTOR_CACHE_SIZE", "2048"))
+VECTOR_CACHE_TTL = float(os.getenv("VECTOR_CACHE_TTL", "60"))
+
 app = FastAPI(title="Request Processor Service", version="2.0.0")
 
 request_service: Optional[RequestService] = None
@@ -79,7 +82,11 @@ async def startup_event():
         
         request_repository = InMemoryRequestRepository()
         
-        request_service = RequestService(request_repository)
+        request_service = RequestService(
+            request_repository,
+            vector_cache_size=VECTOR_CACHE_SIZE,
+            vector_cache_ttl=VECTOR_CACHE_TTL
+        )
         
         logger.info("✅ Request Processor Service готов к работе")
         
@@ -291,4 +298,11 @@ async def get_pending_requests():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8004)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8004,
+        loop="uvloop",
+        http="httptools",
+        access_log=False
+    )
@@ -3,7 +3,8 @@
 """
 import time
 import logging
-from typing import List, Optional, Dict, Any
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Tuple
 import aiohttp
 import asyncio
 
@@ -16,11 +17,19 @@ logger = logging.getLogger(__name__)
 class RequestService:
     """Доменный сервис для обработки запросов"""
     
-    def __init__(self, request_repository: RequestRepository):
+    def __init__(self, request_repository: RequestRepository,
+                 vector_cache_size: int = 2048, vector_cache_ttl: float = 60.0):
         self.request_repository = request_repository
         self.ai_model_url = "http://ai-model:8003"
         self.vectorstore_url = "http://vectorstore:8002"
         self.payment_url = "http://payment:8005"
+        
+        # Поиск детерминирован для запроса: повторы не ходят в Vector Store.
+        # Ответ AI Model генерируется с сэмплированием и не кэшируется;
+        # TTL ограничивает устаревание после обновления базы
+        self._vector_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._vector_cache_size = vector_cache_size
+        self._vector_cache_ttl = vector_cache_ttl
     
     async def process_request(self, query: str, user_id: str = None, session_id: str = None, services: List[str] = None) -> Dict[str, Any]:
         """Обработать запрос"""
@@ -108,7 +117,26 @@ class RequestService:
                     raise Exception(f"AI Model Service error: {response.status}")
     
     async def _call_vectorstore(self, query: str) -> Dict[str, Any]:
-        """Вызвать Vector Store Service"""
+        """Вызвать Vector Store Service с кэшем по нормализованному запросу"""
+        cache_key = " ".join(query.split())
+        cached = self._vector_cache.get(cache_key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time.monotonic():
+                self._vector_cache.move_to_end(cache_key)
+                return result
+            del self._vector_cache[cache_key]
+        
+        # Нормализованная строка - только ключ кэша, в Vector Store уходит
+        # исходный текст пользователя
+        result = await self._search_vectorstore(query)
+        self._vector_cache[cache_key] = (time.monotonic() + self._vector_cache_ttl, result)
+        if len(self._vector_cache) > self._vector_cache_size:
+            self._vector_cache.popitem(last=False)
+        return result
+    
+    async def _search_vectorstore(self, query: str) -> Dict[str, Any]:
+        """Выполнить поиск в Vector Store Service"""
         async with aiohttp.ClientSession() as session:
             async with session.post(
                 f"{self.vectorstore_url}/search",
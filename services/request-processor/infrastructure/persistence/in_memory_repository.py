@@ -4,7 +4,7 @@ In-Memory реализация репозитория для Request Processor S
 import logging
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter, defaultdict
 
 from domain.repositories.request_repository import RequestRepository
 from domain.entities.request import Request
@@ -63,22 +63,25 @@ class InMemoryRequestRepository(RequestRepository):
     
     def get_statistics(self) -> Dict[str, Any]:
         """Получить статистику"""
-        total_requests = len(self.requests)
-        completed_requests = len([r for r in self.requests.values() if r.status == "completed"])
-        failed_requests = len([r for r in self.requests.values() if r.status == "failed"])
-        pending_requests = len([r for r in self.requests.values() if r.status == "pending"])
+        # Статусы и время обработки собираются за один проход по запросам
+        statuses = Counter()
+        processing_time_total = 0.0
+        processing_time_count = 0
+        for request in self.requests.values():
+            statuses[request.status] += 1
+            if request.processing_time:
+                processing_time_total += request.processing_time
+                processing_time_count += 1
         
         avg_processing_time = 0.0
-        if completed_requests > 0:
-            processing_times = [r.processing_time for r in self.requests.values() if r.processing_time]
-            if processing_times:
-                avg_processing_time = sum(processing_times) / len(processing_times)
+        if statuses["completed"] > 0 and processing_time_count:
+            avg_processing_time = processing_time_total / processing_time_count
         
         return {
-            "total_requests": total_requests,
-            "completed_requests": completed_requests,
-            "failed_requests": failed_requests,
-            "pending_requests": pending_requests,
+            "total_requests": len(self.requests),
+            "completed_requests": statuses["completed"],
+            "failed_requests": statuses["failed"],
+            "pending_requests": statuses["pending"],
             "avg_processing_time": avg_processing_time,
             "unique_users": len(self.user_requests)
         }
@@ -2,12 +2,14 @@
 Scraper Service API - полностью независимый микросервис
 """
 import logging
+import queue
 import time
 import asyncio
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import os
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from pydantic import BaseModel
@@ -17,12 +19,26 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from domain.services.scraper_service import ScraperService
 from infrastructure.persistence.in_memory_repository import InMemoryScraperRepository
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Записи пишутся в очередь, а вывод выполняет отдельный поток QueueListener,
+# чтобы форматирование и I/O логов не блокировали event loop
+log_queue: queue.Queue = queue.Queue(-1)
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, log_handler, respect_handler_level=True)
+log_listener.start()
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(QueueHandler(log_queue))
 logger = logging.getLogger(__name__)
 
+SCRAPER_MAX_PAGES = int(os.getenv("SCRAPER_MAX_PAGES", "2"))
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "8"))
+SCRAPER_TIMEOUT = float(os.getenv("SCRAPER_TIMEOUT", "60"))
+SCRAPER_PARSE_WORKERS = int(os.getenv("SCRAPER_PARSE_WORKERS", "0")) or None
+# Базовая пауза перед повтором после 429/503, если сервер не прислал Retry-After
+SCRAPER_DELAY = float(os.getenv("SCRAPER_DELAY", "1.0"))
+
 app = FastAPI(title="Scraper Service", version="2.0.0")
 
 scraper_service: Optional[ScraperService] = None
@@ -94,7 +110,14 @@ async def startup_event():
         
         scraper_repository = InMemoryScraperRepository()
         
-        scraper_service = ScraperService(scraper_repository)
+        scraper_service = ScraperService(
+            scraper_repository,
+            max_pages=SCRAPER_MAX_PAGES,
+            max_concurrency=SCRAPER_CONCURRENCY,
+            timeout=SCRAPER_TIMEOUT,
+            parse_workers=SCRAPER_PARSE_WORKERS,
+            retry_backoff=SCRAPER_DELAY
+        )
         
         logger.info("✅ Scraper Service готов к работе")
         
@@ -115,6 +138,8 @@ async def shutdown_event():
         
     except Exception as e:
         logger.error(f"❌ Ошибка завершения Scraper Service: {e}")
+    finally:
+        log_listener.stop()
 
 
 @app.get("/health")
@@ -0,0 +1,19 @@
+"""
+Доменная сущность Material для Scraper Service
+"""
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class Material:
+    """Материал из федерального списка экстремистских материалов"""
+    number: str
+    description: str
+    date: str = ""
+
+    @property
+    def full_text(self) -> str:
+        """Текст материала для индексации"""
+        if not self.number and not self.date:
+            return self.description
+        return f"№{self.number} {self.description} {self.date}".strip()
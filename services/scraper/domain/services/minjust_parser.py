@@ -0,0 +1,75 @@
+"""
+Парсер федерального списка экстремистских материалов Минюста
+"""
+import re
+import sys
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import lxml.html
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from ..entities.material import Material
+
+# XPath компилируются один раз: строки всех таблиц без заголовка выбираются
+# одним проходом по дереву, ячейки - относительно строки
+ROWS_XPATH = etree.XPath("//table//tr[position() > 1]")
+CELLS_XPATH = etree.XPath("./td|./th")
+
+# Классы блоков списка на страницах без таблицы
+FALLBACK_CLASS_RE = re.compile(r"item|entry|material")
+
+
+@lru_cache(maxsize=8)
+def _html_parser(encoding: Optional[str]) -> lxml.html.HTMLParser:
+    """Парсер lxml для кодировки страницы"""
+    return lxml.html.HTMLParser(encoding=encoding)
+
+
+def parse_page(html: bytes, encoding: Optional[str] = None) -> Tuple[Optional[str], List[Material]]:
+    """Извлечь заголовок и материалы из HTML страницы списка"""
+    # Байты ответа разбираются напрямую, без декодирования в str и обратного
+    # кодирования; кодировка из заголовков ответа нужна страницам без meta charset
+    try:
+        tree = lxml.html.fromstring(html, parser=_html_parser(encoding))
+    except etree.ParserError:
+        return None, []
+
+    title = tree.findtext(".//title")
+    return (title.strip() if title else None), _parse_materials(tree, html)
+
+
+def parse_materials(html: bytes, encoding: Optional[str] = None) -> List[Material]:
+    """Извлечь материалы из HTML страницы списка"""
+    return parse_page(html, encoding)[1]
+
+
+def _parse_materials(tree: lxml.html.HtmlElement, html: bytes) -> List[Material]:
+    """Извлечь материалы из разобранного дерева страницы"""
+    materials = []
+
+    for row in ROWS_XPATH(tree):
+        cells = CELLS_XPATH(row)
+        if len(cells) < 3:
+            continue
+
+        # Номера и даты массово повторяются между строками: интернирование
+        # оставляет одну копию строки, в том числе при передаче из пула процессов
+        number = sys.intern(cells[0].text_content().strip())
+        description = cells[1].text_content().strip()
+        date = sys.intern(cells[2].text_content().strip())
+        if not description:
+            continue
+
+        materials.append(Material(number, description, date))
+
+    if not materials:
+        # Страницы без таблицы: материалы размечены блоками списка
+        soup = BeautifulSoup(html, "lxml")
+        for item in soup.find_all(["li", "div"], class_=FALLBACK_CLASS_RE):
+            description = item.get_text(strip=True)
+            if description:
+                materials.append(Material("", description))
+
+    return materials
@@ -3,30 +3,69 @@
 """
 import logging
 import asyncio
-import aiohttp
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+import re
+import httpx
+import orjson
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional, Dict, Any, Set, Tuple
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import os
 
+from ..entities.material import Material
 from ..entities.scraped_data import ScrapedData, ScrapingJob
 from ..repositories.scraper_repository import ScraperRepository
+from .minjust_parser import parse_page
 
 logger = logging.getLogger(__name__)
 
+# Ответы, после которых сервер ожидает повтора позже
+RETRY_STATUSES = frozenset({429, 503})
+MAX_RETRY_DELAY = 60.0
+
+# Тела запросов к Vector Store сериализуются orjson, а не стандартным json
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+TITLE_RE = re.compile(r'<title[^>]*>([^<]+)</title>', re.IGNORECASE)
+
 
 class ScraperService:
     """Доменный сервис для работы со скрапингом"""
     
-    def __init__(self, scraper_repository: ScraperRepository):
+    def __init__(self, scraper_repository: ScraperRepository, max_pages: int = 2,
+                 max_concurrency: int = 8, max_empty_pages: int = 2, timeout: float = 60.0,
+                 parse_workers: Optional[int] = None, vectorstore_batch_size: int = 512,
+                 max_retries: int = 3, retry_backoff: float = 1.0):
         self.scraper_repository = scraper_repository
         self.vectorstore_url = "http://vectorstore:8002"
-        self.session = None
+        self.max_pages = max_pages
+        self.max_concurrency = max_concurrency
+        self.max_empty_pages = max_empty_pages
+        self.timeout = timeout
+        self.vectorstore_batch_size = vectorstore_batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.client: Optional[httpx.AsyncClient] = None
+        # Разбор HTML упирается в CPU и GIL, поэтому выполняется в отдельных процессах
+        self._parse_pool = ProcessPoolExecutor(max_workers=parse_workers or os.cpu_count())
     
-    async def _get_session(self) -> aiohttp.ClientSession:
-        """Получить HTTP сессию"""
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
-        return self.session
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Получить HTTP клиент"""
+        if self.client is None or self.client.is_closed:
+            # HTTP/2 мультиплексирует запросы страниц в одном TLS-соединении,
+            # число соединений ограничено окном одновременно загружаемых страниц
+            self.client = httpx.AsyncClient(
+                # brotli сжимает HTML заметно сильнее gzip; распаковка выполняется
+                # в C-расширении brotli на стороне httpx
+                headers={"Accept-Encoding": "br, gzip, deflate"},
+                timeout=self.timeout,
+                transport=httpx.AsyncHTTPTransport(
+                    http2=True,
+                    retries=3,
+                    limits=httpx.Limits(max_connections=self.max_concurrency, keepalive_expiry=60)
+                )
+            )
+        return self.client
     
     async def create_scraping_job(self, source_url: str, job_type: str = "minjust") -> ScrapingJob:
         """Создать задачу скрапинга"""
@@ -54,13 +93,13 @@ class ScraperService:
             logger.info(f"Выполняем задачу скрапинга: {job_id}")
             
             if job.job_type == "minjust":
+                # Материалы отправляются в Vector Store по мере загрузки страниц
                 scraped_data = await self._scrape_minjust(job.source_url)
+                data_id = self.scraper_repository.save_scraped_data(scraped_data)
             else:
                 scraped_data = await self._scrape_generic(job.source_url)
-            
-            data_id = self.scraper_repository.save_scraped_data(scraped_data)
-            
-            await self._send_to_vectorstore(scraped_data)
+                data_id = self.scraper_repository.save_scraped_data(scraped_data)
+                await self._send_to_vectorstore(scraped_data)
             
             job.complete()
             self.scraper_repository.update_job_status(job_id, "completed")
@@ -88,62 +127,188 @@ class ScraperService:
     
     async def _scrape_minjust(self, url: str) -> ScrapedData:
         """Скрапить данные с сайта Минюста"""
-        session = await self._get_session()
+        scraped_at = datetime.now().isoformat()
+        texts = []
+        title = None
+        pages_scraped = 0
+        batch: List[Material] = []
+        send_task: Optional[asyncio.Task] = None
+        # Соседние страницы могут пересекаться; дубликаты отсекаются до отправки
+        # в Vector Store по целочисленному хэшу номера и описания
+        seen: Set[int] = set()
+        duplicates = 0
         
         try:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise Exception(f"HTTP {response.status}: {response.reason}")
-                
-                content = await response.text()
+            # Пакет отправляется в фоне, пока загружаются следующие страницы;
+            # в полете не больше одного пакета
+            async for page_title, items in self.iter_minjust_pages(url):
+                if title is None:
+                    title = page_title
+                pages_scraped += 1
                 
-                title = self._extract_title(content)
-                
-                scraped_data = ScrapedData(
-                    id=None,
-                    source_url=url,
-                    content=content,
-                    title=title,
-                    metadata={
-                        "scraper_type": "minjust",
-                        "content_length": len(content),
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                )
+                for material in items:
+                    key = hash((material.number, material.description))
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    texts.append(material.full_text)
+                    batch.append(material)
                 
+                if len(batch) >= self.vectorstore_batch_size:
+                    if send_task:
+                        await send_task
+                    send_task = asyncio.create_task(
+                        self._send_materials_to_vectorstore(url, scraped_at, batch)
+                    )
+                    batch = []
+            
+            if send_task:
+                await send_task
+            if batch:
+                await self._send_materials_to_vectorstore(url, scraped_at, batch)
+            
+            if not texts:
+                # Разметка страницы не распознана: сохраняем и индексируем текст
+                # страницы целиком, как до разбора по материалам
+                logger.warning("Материалы на %s не найдены, сохраняем страницу целиком", url)
+                scraped_data = await self._scrape_generic(url)
+                scraped_data.metadata["scraper_type"] = "minjust"
+                await self._send_to_vectorstore(scraped_data)
                 return scraped_data
-                
+            
+            content = "\n".join(texts)
+            
+            scraped_data = ScrapedData(
+                id=None,
+                source_url=url,
+                content=content,
+                title=title,
+                metadata={
+                    "scraper_type": "minjust",
+                    "content_length": len(content),
+                    "materials_count": len(texts),
+                    "pages_scraped": pages_scraped,
+                    "duplicates_skipped": duplicates,
+                    "scraped_at": scraped_at
+                }
+            )
+            
+            return scraped_data
+            
         except Exception as e:
+            if send_task and not send_task.done():
+                send_task.cancel()
             logger.error(f"Ошибка скрапинга {url}: {e}")
             raise
     
+    async def iter_minjust_pages(self, url: str) -> AsyncIterator[Tuple[Optional[str], List[Material]]]:
+        """Выдавать (заголовок, материалы) по каждой непустой странице списка"""
+        loop = asyncio.get_running_loop()
+        empty_pages = 0
+        page = 1
+        
+        # Страницы загружаются окнами по max_concurrency штук, разбор HTML
+        # выполняется в пуле процессов и не блокирует event loop
+        while page <= self.max_pages and empty_pages < self.max_empty_pages:
+            window = range(page, min(page + self.max_concurrency, self.max_pages + 1))
+            responses = await asyncio.gather(
+                *(self._fetch_page(self._page_url(url, number)) for number in window)
+            )
+            parsed = await asyncio.gather(
+                *(
+                    loop.run_in_executor(self._parse_pool, parse_page, response.content, response.charset_encoding)
+                    for response in responses if response is not None
+                )
+            )
+            
+            parsed_iter = iter(parsed)
+            for number, response in zip(window, responses):
+                title, items = next(parsed_iter) if response is not None else (None, [])
+                if not items:
+                    empty_pages += 1
+                    if empty_pages >= self.max_empty_pages:
+                        break
+                    continue
+                
+                empty_pages = 0
+                logger.info("Страница %d: найдено %d материалов", number, len(items))
+                yield title, items
+            
+            page += len(window)
+    
+    async def _fetch_page(self, url: str) -> Optional[httpx.Response]:
+        """Загрузить страницу, None - если страницы нет"""
+        client = await self._get_client()
+        
+        # Темп задается окном одновременных запросов; пауза делается только
+        # когда сервер сам просит подождать
+        for attempt in range(self.max_retries + 1):
+            response = await client.get(url)
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self._retry_delay(response, attempt)
+                logger.warning("HTTP %d для %s, повтор через %.1fс", response.status_code, url, delay)
+                await asyncio.sleep(delay)
+                continue
+            break
+        
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.reason_phrase}")
+        return response
+    
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """Пауза перед повтором: Retry-After сервера или экспоненциальная"""
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0.0), MAX_RETRY_DELAY)
+        return min(self.retry_backoff * 2 ** attempt, MAX_RETRY_DELAY)
+    
+    @staticmethod
+    def _page_url(url: str, page: int) -> str:
+        """Адрес страницы списка с номером page"""
+        # Первая страница - адрес, указанный пользователем, без изменений
+        if page == 1:
+            return url
+        separator = "&" if "?" in url else "?"
+        return f"{url}{separator}page={page}"
+    
     async def _scrape_generic(self, url: str) -> ScrapedData:
         """Скрапить данные с любого сайта"""
-        session = await self._get_session()
+        client = await self._get_client()
         
         try:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise Exception(f"HTTP {response.status}: {response.reason}")
-                
-                content = await response.text()
-                
-                title = self._extract_title(content)
-                
-                scraped_data = ScrapedData(
-                    id=None,
-                    source_url=url,
-                    content=content,
-                    title=title,
-                    metadata={
-                        "scraper_type": "generic",
-                        "content_length": len(content),
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                )
-                
-                return scraped_data
-                
+            response = await client.get(url)
+            if response.status_code != 200:
+                raise Exception(f"HTTP {response.status_code}: {response.reason_phrase}")
+            
+            content = response.text
+            
+            title = self._extract_title(content)
+            
+            scraped_data = ScrapedData(
+                id=None,
+                source_url=url,
+                content=content,
+                title=title,
+                metadata={
+                    "scraper_type": "generic",
+                    "content_length": len(content),
+                    "scraped_at": datetime.now().isoformat()
+                }
+            )
+            
+            return scraped_data
+            
         except Exception as e:
             logger.error(f"Ошибка скрапинга {url}: {e}")
             raise
@@ -151,8 +316,7 @@ class ScraperService:
     def _extract_title(self, content: str) -> Optional[str]:
         """Извлечь заголовок из HTML"""
         try:
-            import re
-            title_match = re.search(r'<title[^>]*>([^<]+)</title>', content, re.IGNORECASE)
+            title_match = TITLE_RE.search(content)
             if title_match:
                 return title_match.group(1).strip()
         except Exception:
@@ -162,7 +326,7 @@ class ScraperService:
     async def _send_to_vectorstore(self, scraped_data: ScrapedData) -> None:
         """Отправить данные в Vector Store"""
         try:
-            session = await self._get_session()
+            client = await self._get_client()
             
             document_data = {
                 "content": scraped_data.content,
@@ -174,19 +338,53 @@ class ScraperService:
                 }
             }
             
-            async with session.post(
+            response = await client.post(
                 f"{self.vectorstore_url}/add-document",
-                json=document_data
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    logger.info(f"Данные отправлены в Vector Store: {result.get('document_id')}")
-                else:
-                    logger.warning(f"Ошибка отправки в Vector Store: {response.status}")
+                content=orjson.dumps(document_data),
+                headers=JSON_HEADERS
+            )
+            if response.status_code == 200:
+                result = response.json()
+                logger.info(f"Данные отправлены в Vector Store: {result.get('document_id')}")
+            else:
+                logger.warning(f"Ошибка отправки в Vector Store: {response.status_code}")
                     
         except Exception as e:
             logger.error(f"Ошибка отправки в Vector Store: {e}")
     
+    async def _send_materials_to_vectorstore(self, source_url: str, scraped_at: str, materials: List[Material]) -> None:
+        """Отправить материалы в Vector Store отдельными документами"""
+        try:
+            client = await self._get_client()
+            
+            documents = [
+                {
+                    "content": material.full_text,
+                    "metadata": {
+                        "source_url": source_url,
+                        "number": material.number,
+                        "date": material.date,
+                        "scraper_type": "minjust",
+                        "scraped_at": scraped_at
+                    }
+                }
+                for material in materials
+            ]
+            
+            response = await client.post(
+                f"{self.vectorstore_url}/add-documents",
+                content=orjson.dumps(documents),
+                headers=JSON_HEADERS
+            )
+            if response.status_code == 200:
+                result = response.json()
+                logger.info("Материалы отправлены в Vector Store: %s", result.get("total_added"))
+            else:
+                logger.warning(f"Ошибка отправки материалов в Vector Store: {response.status_code}")
+                    
+        except Exception as e:
+            logger.error(f"Ошибка отправки материалов в Vector Store: {e}")
+    
     def get_scraped_data(self, data_id: str) -> Optional[ScrapedData]:
         """Получить скрапленные данные по ID"""
         return self.scraper_repository.get_scraped_data(data_id)
@@ -220,6 +418,7 @@ class ScraperService:
         return self.scraper_repository.delete_scraping_job(job_id)
     
     async def close(self):
-        """Закрыть сессию"""
-        if self.session and not self.session.closed:
-            await self.session.close()
+        """Закрыть HTTP клиент и пул разбора"""
+        if self.client and not self.client.is_closed:
+            await self.client.aclose()
+        self._parse_pool.shutdown(cancel_futures=True)
@@ -4,7 +4,7 @@ In-Memory реализация репозитория для Scraper Service
 import logging
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter, defaultdict
 
 from domain.repositories.scraper_repository import ScraperRepository
 from domain.entities.scraped_data import ScrapedData, ScrapingJob
@@ -80,27 +80,20 @@ class InMemoryScraperRepository(ScraperRepository):
     
     def get_statistics(self) -> Dict[str, Any]:
         """Получить статистику"""
-        total_data = len(self.scraped_data)
-        processed_data = len([d for d in self.scraped_data.values() if d.status == "processed"])
-        failed_data = len([d for d in self.scraped_data.values() if d.status == "failed"])
-        pending_data = len([d for d in self.scraped_data.values() if d.status == "pending"])
-        
-        total_jobs = len(self.scraping_jobs)
-        completed_jobs = len([j for j in self.scraping_jobs.values() if j.status == "completed"])
-        failed_jobs = len([j for j in self.scraping_jobs.values() if j.status == "failed"])
-        pending_jobs = len([j for j in self.scraping_jobs.values() if j.status == "pending"])
-        running_jobs = len([j for j in self.scraping_jobs.values() if j.status == "running"])
+        # Один проход по каждой коллекции вместо отдельного прохода на каждый статус
+        data_statuses = Counter(d.status for d in self.scraped_data.values())
+        job_statuses = Counter(j.status for j in self.scraping_jobs.values())
         
         return {
-            "total_scraped_data": total_data,
-            "processed_data": processed_data,
-            "failed_data": failed_data,
-            "pending_data": pending_data,
-            "total_jobs": total_jobs,
-            "completed_jobs": completed_jobs,
-            "failed_jobs": failed_jobs,
-            "pending_jobs": pending_jobs,
-            "running_jobs": running_jobs
+            "total_scraped_data": len(self.scraped_data),
+            "processed_data": data_statuses["processed"],
+            "failed_data": data_statuses["failed"],
+            "pending_data": data_statuses["pending"],
+            "total_jobs": len(self.scraping_jobs),
+            "completed_jobs": job_statuses["completed"],
+            "failed_jobs": job_statuses["failed"],
+            "pending_jobs": job_statuses["pending"],
+            "running_jobs": job_statuses["running"]
         }
     
     def delete_scraped_data(self, data_id: str) -> bool:
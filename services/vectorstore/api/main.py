@@ -30,6 +30,20 @@ MODEL_NAME = os.getenv("VECTOR_STORE_MODEL", "sentence-transformers/all-MiniLM-L
 INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "IndexFlatIP")
 RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.3"))
 TOP_K_RESULTS = int(os.getenv("TOP_K_RESULTS", "5"))
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", "32"))
+SEARCH_BATCH_WAIT_MS = float(os.getenv("SEARCH_BATCH_WAIT_MS", "5"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "10000"))
+MAX_SEARCH_BATCH_QUERIES = int(os.getenv("MAX_SEARCH_BATCH_QUERIES", "256"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "128"))
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "1"))
+INDEX_MMAP = os.getenv("VECTOR_INDEX_MMAP", "false").lower() == "true"
+IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", "100"))
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "10"))
+PQ_M = int(os.getenv("VECTOR_PQ_M", "16"))
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
 
 
 class DocumentRequest(BaseModel):
@@ -56,6 +70,30 @@ class SearchResponse(BaseModel):
     error: Optional[str] = None
 
 
+class BatchSearchRequest(BaseModel):
+    """Запрос для пакетного поиска"""
+    queries: List[str]
+    top_k: int = TOP_K_RESULTS
+    threshold: float = RELEVANCE_THRESHOLD
+
+
+class BatchSearchItem(BaseModel):
+    """Результаты поиска для одного запроса пакета"""
+    query: str
+    results: List[Dict[str, Any]]
+    total_results: int
+
+
+class BatchSearchResponse(BaseModel):
+    """Ответ на пакетный поиск"""
+    success: bool
+    results: List[BatchSearchItem]
+    processing_time: float
+    timestamp: str
+    total_queries: int
+    error: Optional[str] = None
+
+
 class DocumentResponse(BaseModel):
     """Ответ для документа"""
     success: bool
@@ -82,9 +120,32 @@ async def startup_event():
     try:
         logger.info("🚀 Инициализация Vector Store Service...")
         
-        vector_repository = OptimizedFAISSRepository(model_name=MODEL_NAME, index_type=INDEX_TYPE)
+        vector_repository = OptimizedFAISSRepository(
+            model_name=MODEL_NAME,
+            index_type=INDEX_TYPE,
+            nlist=IVF_NLIST,
+            nprobe=IVF_NPROBE,
+            pq_m=PQ_M,
+            hnsw_m=HNSW_M,
+            ef_construction=HNSW_EF_CONSTRUCTION,
+            ef_search=HNSW_EF_SEARCH,
+            encode_batch_size=ENCODE_BATCH_SIZE,
+            index_mmap=INDEX_MMAP
+        )
         
-        vector_service = VectorService(vector_repository, MODEL_NAME)
+        vector_service = VectorService(
+            vector_repository,
+            MODEL_NAME,
+            max_batch_size=SEARCH_BATCH_SIZE,
+            max_batch_wait=SEARCH_BATCH_WAIT_MS / 1000,
+            search_cache_size=SEARCH_CACHE_SIZE,
+            embedding_cache_size=EMBEDDING_CACHE_SIZE,
+            encode_batch_size=ENCODE_BATCH_SIZE,
+            encode_workers=ENCODE_WORKERS,
+            embedding_model=vector_repository.model
+        )
+        # Первый запрос не ждет инициализации ядер и аллокаторов модели
+        await vector_service.warmup()
         
         logger.info("✅ Vector Store Service готов к работе")
         
@@ -93,6 +154,18 @@ async def startup_event():
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Очистка при завершении"""
+    try:
+        if vector_service:
+            await vector_service.close()
+        logger.info("✅ Vector Store Service завершен")
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка завершения Vector Store Service: {e}")
+
+
 @app.get("/health")
 async def health_check():
     """Проверка здоровья сервиса"""
@@ -126,7 +199,7 @@ async def add_document(request: DocumentRequest):
         
         logger.info(f"Добавляем документ: {request.content[:50]}...")
         
-        document_id = vector_service.add_document(
+        document_id = await vector_service.add_document(
             content=request.content,
             metadata=request.metadata
         )
@@ -163,7 +236,7 @@ async def add_documents(documents: List[DocumentRequest]):
                 "metadata": doc.metadata
             })
         
-        document_ids = vector_service.add_documents(docs_data)
+        document_ids = await vector_service.add_documents(docs_data)
         
         processing_time = time.time() - start_time
         
@@ -189,7 +262,7 @@ async def search_documents(request: SearchRequest):
         
         start_time = time.time()
         
-        logger.info(f"Поиск: {request.query[:50]}...")
+        logger.info("Поиск: %.50s...", request.query)
         
         results = await vector_service.search_similar(
             query=request.query,
@@ -198,7 +271,7 @@ async def search_documents(request: SearchRequest):
         )
         
         results_data = []
-        logger.info(f"Преобразуем {len(results)} результатов поиска")
+        logger.debug("Преобразуем %d результатов поиска", len(results))
         
         for i, result in enumerate(results):
             try:
@@ -232,6 +305,93 @@ async def search_documents(request: SearchRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/search-batch", response_model=BatchSearchResponse)
+async def search_documents_batch(request: BatchSearchRequest):
+    """Пакетный поиск документов: один HTTP-запрос и одно кодирование на пакет"""
+    try:
+        if vector_service is None:
+            raise HTTPException(status_code=503, detail="Service not initialized")
+        if len(request.queries) > MAX_SEARCH_BATCH_QUERIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many queries: {len(request.queries)} > {MAX_SEARCH_BATCH_QUERIES}"
+            )
+        
+        start_time = time.time()
+        
+        batch_results = await vector_service.search_similar_batch(
+            queries=request.queries,
+            top_k=request.top_k,
+            threshold=request.threshold
+        )
+        
+        items = []
+        for query, results in zip(request.queries, batch_results):
+            results_data = [
+                {
+                    "document_id": result.document_id,
+                    "content": result.content,
+                    "relevance_score": result.relevance_score,
+                    "distance": result.distance,
+                    "metadata": result.metadata
+                }
+                for result in results
+            ]
+            items.append(BatchSearchItem(query=query, results=results_data, total_results=len(results_data)))
+        
+        return BatchSearchResponse(
+            success=True,
+            results=items,
+            processing_time=time.time() - start_time,
+            timestamp=datetime.now().isoformat(),
+            total_queries=len(items)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка пакетного поиска: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/search-keywords", response_model=SearchResponse)
+async def search_keywords(request: SearchRequest):
+    """Точный поиск документов по словам запроса"""
+    try:
+        if vector_service is None:
+            raise HTTPException(status_code=503, detail="Service not initialized")
+        
+        start_time = time.time()
+        
+        results = vector_service.search_keywords(request.query, limit=request.top_k)
+        
+        results_data = [
+            {
+                "document_id": result.document_id,
+                "content": result.content,
+                "relevance_score": result.relevance_score,
+                "distance": result.distance,
+                "metadata": result.metadata
+            }
+            for result in results
+        ]
+        
+        return SearchResponse(
+            success=True,
+            results=results_data,
+            processing_time=time.time() - start_time,
+            timestamp=datetime.now().isoformat(),
+            query=request.query,
+            total_results=len(results_data)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка поиска по словам: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/document/{document_id}")
 async def get_document(document_id: str):
     """Получить документ по ID"""
@@ -270,7 +430,7 @@ async def update_document(document_id: str, request: DocumentRequest):
         
         logger.info(f"Обновляем документ: {document_id}")
         
-        success = vector_service.update_document(
+        success = await vector_service.update_document(
             document_id=document_id,
             content=request.content,
             metadata=request.metadata
@@ -391,7 +551,7 @@ async def clear_index():
         
         logger.info("Очищаем индекс...")
         
-        success = vector_service.clear_index()
+        success = await vector_service.clear_index()
         
         return {
             "success": success,
@@ -412,7 +572,7 @@ async def rebuild_index():
         
         logger.info("Перестраиваем индекс...")
         
-        success = vector_service.rebuild_index()
+        success = await vector_service.rebuild_index()
         
         return {
             "success": success,
@@ -426,4 +586,11 @@ async def rebuild_index():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8002,
+        loop="uvloop",
+        http="httptools",
+        access_log=False
+    )
@@ -25,12 +25,22 @@ class VectorRepository(ABC):
         pass
     
     @abstractmethod
-    def add_documents(self, documents: List[VectorDocument]) -> List[str]:
+    async def search_similar_batch(self, query_embeddings: List[List[float]], top_k: int = 5, threshold: float = 0.3) -> List[List[SearchResult]]:
+        """Пакетный поиск похожих документов"""
+        pass
+    
+    @abstractmethod
+    def search_keywords(self, query: str, limit: int = 10) -> List[SearchResult]:
+        """Поиск документов, содержащих все слова запроса"""
+        pass
+    
+    @abstractmethod
+    async def add_documents(self, documents: List[VectorDocument]) -> List[str]:
         """Добавить несколько документов"""
         pass
     
     @abstractmethod
-    def update_document(self, document_id: str, document: VectorDocument) -> bool:
+    async def update_document(self, document_id: str, document: VectorDocument) -> bool:
         """Обновить документ"""
         pass
     
@@ -50,11 +60,11 @@ class VectorRepository(ABC):
         pass
     
     @abstractmethod
-    def clear_index(self) -> bool:
+    async def clear_index(self) -> bool:
         """Очистить индекс"""
         pass
     
     @abstractmethod
-    def rebuild_index(self) -> bool:
+    async def rebuild_index(self) -> bool:
         """Перестроить индекс"""
         pass
@@ -0,0 +1,70 @@
+"""
+Инвертированный индекс токенов для точного поиска по словам
+"""
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> Set[str]:
+    """Получить множество токенов текста в нижнем регистре"""
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class TokenIndex:
+    """Списки документов по токенам: поиск документов, содержащих все слова запроса"""
+
+    def __init__(self):
+        self.postings: Dict[str, Set[str]] = defaultdict(set)
+        # Токены каждого документа: удаление не зависит от текущего текста документа
+        self.document_tokens: Dict[str, Set[str]] = {}
+
+    def add(self, document_id: str, content: str):
+        """Добавить токены документа"""
+        self.remove(document_id)
+        tokens = self.document_tokens[document_id] = tokenize(content)
+        for token in tokens:
+            self.postings[token].add(document_id)
+
+    def add_many(self, documents: Iterable):
+        """Добавить токены нескольких документов (id, content)"""
+        for document_id, content in documents:
+            self.add(document_id, content)
+
+    def remove(self, document_id: str):
+        """Удалить токены документа"""
+        for token in self.document_tokens.pop(document_id, ()):
+            document_ids = self.postings.get(token)
+            if document_ids is None:
+                continue
+            document_ids.discard(document_id)
+            if not document_ids:
+                del self.postings[token]
+
+    def clear(self):
+        """Очистить индекс"""
+        self.postings.clear()
+        self.document_tokens.clear()
+
+    def search(self, query: str) -> List[str]:
+        """Найти документы, содержащие все токены запроса"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        # Пересечение начинается с самого короткого списка
+        postings = sorted((self.postings.get(token, ()) for token in tokens), key=len)
+        if not postings[0]:
+            return []
+
+        candidates = set(postings[0])
+        for document_ids in postings[1:]:
+            candidates.intersection_update(document_ids)
+            if not candidates:
+                break
+
+        # ID - числа в виде строк: сортировка по длине, затем по строке дает
+        # порядок добавления ("2" раньше "10"), и срез по limit берет первые
+        return sorted(candidates, key=lambda document_id: (len(document_id), document_id))
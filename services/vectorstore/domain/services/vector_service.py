@@ -1,42 +1,120 @@
 """
 Доменный сервис для работы с векторными документами в Vector Store Service
 """
-from typing import List, Optional, Dict, Any
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, Tuple
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 from ..entities.vector_document import VectorDocument, SearchResult
 from ..repositories.vector_repository import VectorRepository
+from .micro_batcher import MicroBatcher
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
 
 
 class VectorService:
     """Доменный сервис для работы с векторными документами"""
     
-    def __init__(self, vector_repository: VectorRepository, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, vector_repository: VectorRepository, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 max_batch_size: int = 32, max_batch_wait: float = 0.005, search_cache_size: int = 10000,
+                 embedding_cache_size: int = 4096, encode_batch_size: int = 128, encode_workers: int = 1,
+                 embedding_model: Optional["SentenceTransformer"] = None):
         self.vector_repository = vector_repository
         self.model_name = model_name
-        self._embedding_model = None
+        # Модель можно передать готовой, например общую с репозиторием
+        self._embedding_model = embedding_model
+        self.encode_batch_size = encode_batch_size
+        # Отдельный пул для кодирования запросов: модель не делит потоки
+        # с default executor и не блокирует event loop
+        self._encode_executor = ThreadPoolExecutor(
+            max_workers=encode_workers,
+            thread_name_prefix="encode",
+            initializer=self._init_encode_thread,
+            initargs=(max(1, (os.cpu_count() or 1) // encode_workers),)
+        )
+        self._search_batcher = MicroBatcher(self._search_batch, max_batch_size, max_batch_wait)
+        self._add_batcher = MicroBatcher(self._add_batch, max_batch_size, max_batch_wait)
+        # LRU результатов поиска: (query, top_k, threshold) -> результаты
+        self._search_cache: "OrderedDict[Tuple[str, int, float], List[SearchResult]]" = OrderedDict()
+        self._search_cache_size = search_cache_size
+        self._search_cache_generation = 0
+        # LRU эмбеддингов запросов: не зависит от содержимого индекса
+        # и не сбрасывается при изменении документов
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embedding_cache_size = embedding_cache_size
     
-    def _get_embedding_model(self) -> SentenceTransformer:
+    def _get_embedding_model(self) -> "SentenceTransformer":
         """Получить модель для эмбеддингов"""
         if self._embedding_model is None:
+            from sentence_transformers import SentenceTransformer
             self._embedding_model = SentenceTransformer(self.model_name)
         return self._embedding_model
     
-    def add_document(self, content: str, metadata: Dict[str, Any]) -> str:
+    async def warmup(self):
+        """Загрузить модель и прогнать пробное кодирование до первого запроса"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._encode_executor, self._encode_batch, ["warmup"])
+    
+    @staticmethod
+    def _init_encode_thread(num_threads: int):
+        """Разделить ядра между потоками кодирования"""
+        import torch
+        # Каждый поток с моделью иначе запускает intra-op пул на все ядра,
+        # и при нескольких потоках кодирования ядра переподписываются
+        torch.set_num_threads(num_threads)
+    
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Получить эмбеддинги пакета текстов за один проход модели"""
+        return self._get_embedding_model().encode(texts, batch_size=len(texts), show_progress_bar=False)
+    
+    def _encode_documents(self, contents: List[str]) -> np.ndarray:
+        """Получить нормализованные эмбеддинги документов"""
+        # Нормализованные векторы: скалярное произведение в индексе равно косинусному сходству
+        return self._get_embedding_model().encode(
+            contents,
+            batch_size=self.encode_batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+    
+    async def add_document(self, content: str, metadata: Dict[str, Any]) -> str:
         """Добавить документ"""
-        document = VectorDocument(
-            id=None,
-            content=content,
-            metadata=metadata
+        # Конкурентные добавления собираются в пакет: одно кодирование
+        # и одна вставка в индекс на весь пакет
+        return await self._add_batcher.submit((content, metadata))
+    
+    async def _add_batch(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """Добавить пакет документов"""
+        vector_documents = [
+            VectorDocument(id=None, content=content, metadata=metadata)
+            for content, metadata in items
+        ]
+        
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(
+            self._encode_executor,
+            self._encode_documents,
+            [document.content for document in vector_documents]
         )
         
-        embedding = self._get_embedding_model().encode(content)
-        document.update_embedding(embedding.tolist())
+        for document, embedding in zip(vector_documents, embeddings):
+            document.update_embedding(embedding.tolist())
         
-        return self.vector_repository.save_document(document)
+        self._invalidate_search_cache()
+        document_ids = await self.vector_repository.add_documents(vector_documents)
+        if len(document_ids) != len(vector_documents):
+            raise RuntimeError("Failed to add documents to the index")
+        return document_ids
     
-    def add_documents(self, documents: List[Dict[str, Any]]) -> List[str]:
+    async def add_documents(self, documents: List[Dict[str, Any]]) -> List[str]:
         """Добавить несколько документов"""
         vector_documents = []
         
@@ -48,45 +126,140 @@ class VectorService:
             )
             vector_documents.append(document)
         
-        contents = [doc.content for doc in vector_documents]
-        embeddings = self._get_embedding_model().encode(contents)
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(
+            self._encode_executor,
+            self._encode_documents,
+            [doc.content for doc in vector_documents]
+        )
         
         for i, document in enumerate(vector_documents):
             document.update_embedding(embeddings[i].tolist())
         
-        return self.vector_repository.add_documents(vector_documents)
+        self._invalidate_search_cache()
+        return await self.vector_repository.add_documents(vector_documents)
     
     async def search_similar(self, query: str, top_k: int = 5, threshold: float = 0.3) -> List[SearchResult]:
         """Поиск похожих документов"""
-        import logging
-        logger = logging.getLogger(__name__)
+        cache_key = (query, top_k, threshold)
+        cached_results = self._search_cache.get(cache_key)
+        if cached_results is not None:
+            self._search_cache.move_to_end(cache_key)
+            return cached_results
         
         try:
-            logger.info(f"VectorService: generating embedding for query: {query[:50]}...")
-            
-            query_embedding = self._get_embedding_model().encode(query)
-            logger.info(f"VectorService: embedding generated, length: {len(query_embedding)}")
+            logger.debug("VectorService: queueing query for batched search: %.50s...", query)
             
-            logger.info(f"VectorService: calling repository.search_similar with top_k={top_k}, threshold={threshold}")
+            generation = self._search_cache_generation
+            results = await self._search_batcher.submit(cache_key)
             
-            results = await self.vector_repository.search_similar(
-                query_embedding=query_embedding.tolist(),
-                top_k=top_k,
-                threshold=threshold
-            )
+            # Документы могли измениться, пока запрос был в очереди
+            if generation == self._search_cache_generation:
+                self._cache_search_results(cache_key, results)
             
-            logger.info(f"VectorService: search completed, found {len(results)} results")
+            logger.debug("VectorService: search completed, found %d results", len(results))
             return results
             
         except Exception as e:
             logger.error(f"VectorService: error in search_similar: {e}")
             raise
     
+    async def search_similar_batch(self, queries: List[str], top_k: int = 5,
+                                   threshold: float = 0.3) -> List[List[SearchResult]]:
+        """Поиск для пакета запросов: одно кодирование и один поиск по индексу"""
+        results: List[List[SearchResult]] = [[] for _ in queries]
+        # Повторяющиеся запросы внутри пакета ищутся один раз
+        misses: Dict[Tuple[str, int, float], List[int]] = {}
+        for position, query in enumerate(queries):
+            cache_key = (query, top_k, threshold)
+            cached_results = self._search_cache.get(cache_key)
+            if cached_results is not None:
+                self._search_cache.move_to_end(cache_key)
+                results[position] = cached_results
+            else:
+                misses.setdefault(cache_key, []).append(position)
+        
+        if misses:
+            # Пакет уже собран: очередь micro-batcher не нужна
+            generation = self._search_cache_generation
+            cache_keys = list(misses)
+            batch_results = await self._search_batch(cache_keys)
+            for cache_key, key_results in zip(cache_keys, batch_results):
+                for position in misses[cache_key]:
+                    results[position] = key_results
+                if generation == self._search_cache_generation:
+                    self._cache_search_results(cache_key, key_results)
+        
+        return results
+    
+    def _cache_search_results(self, cache_key: Tuple[str, int, float], results: List[SearchResult]):
+        """Сохранить результаты поиска в LRU"""
+        self._search_cache[cache_key] = results
+        if len(self._search_cache) > self._search_cache_size:
+            self._search_cache.popitem(last=False)
+    
+    def search_keywords(self, query: str, limit: int = 10) -> List[SearchResult]:
+        """Поиск документов, содержащих все слова запроса"""
+        return self.vector_repository.search_keywords(query, limit)
+    
+    async def _search_batch(self, items: List[Tuple[str, int, float]]) -> List[List[SearchResult]]:
+        """Выполнить пакет поисковых запросов: одно кодирование и поиск по группам параметров"""
+        embeddings = await self._encode_queries([query for query, _, _ in items])
+        
+        groups: Dict[Tuple[int, float], List[int]] = {}
+        for position, (_, top_k, threshold) in enumerate(items):
+            groups.setdefault((top_k, threshold), []).append(position)
+        
+        results: List[List[SearchResult]] = [[] for _ in items]
+        for (top_k, threshold), positions in groups.items():
+            group_results = await self.vector_repository.search_similar_batch(
+                query_embeddings=embeddings[positions],
+                top_k=top_k,
+                threshold=threshold
+            )
+            for position, position_results in zip(positions, group_results):
+                results[position] = position_results
+        
+        return results
+    
+    async def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Получить эмбеддинги запросов, кодируя только отсутствующие в кэше"""
+        cache = self._embedding_cache
+        embeddings: Dict[str, np.ndarray] = {}
+        for query in queries:
+            embedding = cache.get(query)
+            if embedding is not None:
+                cache.move_to_end(query)
+                embeddings[query] = embedding
+        
+        missing = [query for query in dict.fromkeys(queries) if query not in embeddings]
+        if missing:
+            # encode - синхронный CPU/GPU вызов, выполняем его вне event loop
+            loop = asyncio.get_running_loop()
+            encoded = await loop.run_in_executor(self._encode_executor, self._encode_batch, missing)
+            for query, embedding in zip(missing, encoded):
+                embeddings[query] = cache[query] = embedding
+                if len(cache) > self._embedding_cache_size:
+                    cache.popitem(last=False)
+        
+        return np.stack([embeddings[query] for query in queries])
+    
+    def _invalidate_search_cache(self):
+        """Сбросить кэш результатов поиска после изменения документов"""
+        self._search_cache.clear()
+        self._search_cache_generation += 1
+    
+    async def close(self):
+        """Остановить пакетную обработку запросов"""
+        await self._search_batcher.close()
+        await self._add_batcher.close()
+        self._encode_executor.shutdown(wait=False)
+    
     def get_document(self, document_id: str) -> Optional[VectorDocument]:
         """Получить документ по ID"""
         return self.vector_repository.get_document(document_id)
     
-    def update_document(self, document_id: str, content: str, metadata: Dict[str, Any]) -> bool:
+    async def update_document(self, document_id: str, content: str, metadata: Dict[str, Any]) -> bool:
         """Обновить документ"""
         existing_doc = self.vector_repository.get_document(document_id)
         if not existing_doc:
@@ -95,13 +268,16 @@ class VectorService:
         existing_doc.content = content
         existing_doc.update_metadata(metadata)
         
-        embedding = self._get_embedding_model().encode(content)
-        existing_doc.update_embedding(embedding.tolist())
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(self._encode_executor, self._encode_documents, [content])
+        existing_doc.update_embedding(embeddings[0].tolist())
         
-        return self.vector_repository.update_document(document_id, existing_doc)
+        self._invalidate_search_cache()
+        return await self.vector_repository.update_document(document_id, existing_doc)
     
     def delete_document(self, document_id: str) -> bool:
         """Удалить документ"""
+        self._invalidate_search_cache()
         return self.vector_repository.delete_document(document_id)
     
     def get_all_documents(self) -> List[VectorDocument]:
@@ -112,13 +288,15 @@ class VectorService:
         """Получить статистику"""
         return await self.vector_repository.get_statistics()
     
-    def clear_index(self) -> bool:
+    async def clear_index(self) -> bool:
         """Очистить индекс"""
-        return self.vector_repository.clear_index()
+        self._invalidate_search_cache()
+        return await self.vector_repository.clear_index()
     
-    def rebuild_index(self) -> bool:
+    async def rebuild_index(self) -> bool:
         """Перестроить индекс"""
-        return self.vector_repository.rebuild_index()
+        self._invalidate_search_cache()
+        return await self.vector_repository.rebuild_index()
     
     def get_model_info(self) -> Dict[str, Any]:
         """Получить информацию о модели"""
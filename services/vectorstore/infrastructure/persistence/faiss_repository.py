@@ -13,6 +13,7 @@ from sentence_transformers import SentenceTransformer
 
 from domain.repositories.vector_repository import VectorRepository
 from domain.entities.vector_document import VectorDocument, SearchResult
+from domain.services.token_index import TokenIndex
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,9 @@ class FAISSRepository(VectorRepository):
         self.index_path = index_path
         self.model_name = model_name
         self.documents: Dict[str, VectorDocument] = {}
+        # ID документов в порядке их векторов в индексе: позиция FAISS -> ID
+        self.index_ids: List[str] = []
+        self.token_index = TokenIndex()
         self.index = None
         self.embedding_model = None
         self._load_or_create_index()
@@ -46,11 +50,17 @@ class FAISSRepository(VectorRepository):
                 with open(docs_file, 'rb') as f:
                     self.documents = pickle.load(f)
                 
+                self.index_ids = [doc_id for doc_id, document in self.documents.items() if document.embedding]
+                self.token_index.add_many(
+                    (doc_id, document.content) for doc_id, document in self.documents.items()
+                )
+                
                 logger.info(f"Индекс загружен: {len(self.documents)} документов")
             else:
                 logger.info("Создаем новый FAISS индекс...")
                 self.index = faiss.IndexFlatIP(embedding_dim)  # Inner Product для косинусного сходства
                 self.documents = {}
+                self.index_ids = []
                 
         except Exception as e:
             logger.error(f"Ошибка загрузки/создания индекса: {e}")
@@ -76,10 +86,13 @@ class FAISSRepository(VectorRepository):
         """Сохранить документ"""
         try:
             self.documents[document.id] = document
+            self.token_index.add(document.id, document.content)
             
             if document.embedding:
                 embedding_array = np.array([document.embedding], dtype=np.float32)
+                faiss.normalize_L2(embedding_array)
                 self.index.add(embedding_array)
+                self.index_ids.append(document.id)
             
             self._save_index()
             
@@ -106,43 +119,87 @@ class FAISSRepository(VectorRepository):
             
             scores, indices = self.index.search(query_array, min(top_k, self.index.ntotal))
             
-            results = []
-            for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if score >= threshold and idx != -1:
-                    doc_id = list(self.documents.keys())[idx]
-                    document = self.documents[doc_id]
-                    
-                    result = SearchResult(
-                        document_id=document.id,
-                        content=document.content,
-                        relevance_score=float(score),
-                        metadata=document.metadata,
-                        distance=1.0 - float(score)
-                    )
-                    results.append(result)
-            
-            return results
+            return self._collect_results(scores[0], indices[0], threshold)
             
         except Exception as e:
             logger.error(f"Ошибка поиска: {e}")
             return []
     
-    def add_documents(self, documents: List[VectorDocument]) -> List[str]:
+    async def search_similar_batch(self, query_embeddings: List[List[float]], top_k: int = 5, threshold: float = 0.3) -> List[List[SearchResult]]:
+        """Пакетный поиск похожих документов"""
+        try:
+            if self.index.ntotal == 0:
+                return [[] for _ in query_embeddings]
+            
+            query_array = np.array(query_embeddings, dtype=np.float32)
+            
+            faiss.normalize_L2(query_array)
+            
+            scores, indices = self.index.search(query_array, min(top_k, self.index.ntotal))
+            
+            return [
+                self._collect_results(row_scores, row_indices, threshold)
+                for row_scores, row_indices in zip(scores, indices)
+            ]
+            
+        except Exception as e:
+            logger.error(f"Ошибка пакетного поиска: {e}")
+            return [[] for _ in query_embeddings]
+    
+    def search_keywords(self, query: str, limit: int = 10) -> List[SearchResult]:
+        """Точный поиск по словам через инвертированный индекс"""
+        results = []
+        for doc_id in self.token_index.search(query)[:limit]:
+            document = self.documents[doc_id]
+            results.append(SearchResult(
+                document_id=document.id,
+                content=document.content,
+                relevance_score=1.0,
+                metadata=document.metadata
+            ))
+        return results
+    
+    def _collect_results(self, scores: np.ndarray, indices: np.ndarray, threshold: float) -> List[SearchResult]:
+        """Собрать результаты поиска выше порога"""
+        keep = np.flatnonzero((scores >= threshold) & (indices != -1))
+        results = []
+        for score, idx in zip(scores[keep].tolist(), indices[keep].tolist()):
+            document = self.documents[self.index_ids[idx]]
+            
+            result = SearchResult(
+                document_id=document.id,
+                content=document.content,
+                relevance_score=score,
+                metadata=document.metadata,
+                distance=1.0 - score
+            )
+            results.append(result)
+        
+        return results
+    
+    async def add_documents(self, documents: List[VectorDocument]) -> List[str]:
         """Добавить несколько документов"""
         try:
             document_ids = []
             embeddings = []
+            embedded_ids = []
             
             for document in documents:
                 self.documents[document.id] = document
+                self.token_index.add(document.id, document.content)
                 document_ids.append(document.id)
                 
                 if document.embedding:
                     embeddings.append(document.embedding)
+                    embedded_ids.append(document.id)
             
             if embeddings:
                 embeddings_array = np.array(embeddings, dtype=np.float32)
+                # Запросы нормализуются при поиске: документы тоже, иначе
+                # скалярное произведение не равно косинусному сходству
+                faiss.normalize_L2(embeddings_array)
                 self.index.add(embeddings_array)
+                self.index_ids.extend(embedded_ids)
             
             self._save_index()
             
@@ -153,15 +210,16 @@ class FAISSRepository(VectorRepository):
             logger.error(f"Ошибка добавления документов: {e}")
             raise
     
-    def update_document(self, document_id: str, document: VectorDocument) -> bool:
+    async def update_document(self, document_id: str, document: VectorDocument) -> bool:
         """Обновить документ"""
         try:
             if document_id not in self.documents:
                 return False
             
             self.documents[document_id] = document
+            self.token_index.add(document_id, document.content)
             
-            self.rebuild_index()
+            self._rebuild_index()
             
             logger.info(f"Документ обновлен: {document_id}")
             return True
@@ -177,8 +235,9 @@ class FAISSRepository(VectorRepository):
                 return False
             
             del self.documents[document_id]
+            self.token_index.remove(document_id)
             
-            self.rebuild_index()
+            self._rebuild_index()
             
             logger.info(f"Документ удален: {document_id}")
             return True
@@ -201,10 +260,12 @@ class FAISSRepository(VectorRepository):
             "model_name": self.model_name
         }
     
-    def clear_index(self) -> bool:
+    async def clear_index(self) -> bool:
         """Очистить индекс"""
         try:
             self.documents.clear()
+            self.index_ids = []
+            self.token_index.clear()
             
             embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
             self.index = faiss.IndexFlatIP(embedding_dim)
@@ -218,20 +279,30 @@ class FAISSRepository(VectorRepository):
             logger.error(f"Ошибка очистки индекса: {e}")
             return False
     
-    def rebuild_index(self) -> bool:
+    async def rebuild_index(self) -> bool:
         """Перестроить индекс"""
+        return self._rebuild_index()
+    
+    def _rebuild_index(self) -> bool:
+        """Перестроить индекс и заменить им текущий"""
         try:
             embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
-            self.index = faiss.IndexFlatIP(embedding_dim)
+            # Новый индекс строится отдельно: поиски не видят его пустым
+            index = faiss.IndexFlatIP(embedding_dim)
             
             embeddings = []
-            for document in self.documents.values():
+            index_ids = []
+            for doc_id, document in self.documents.items():
                 if document.embedding:
                     embeddings.append(document.embedding)
+                    index_ids.append(doc_id)
             
             if embeddings:
                 embeddings_array = np.array(embeddings, dtype=np.float32)
-                self.index.add(embeddings_array)
+                faiss.normalize_L2(embeddings_array)
+                index.add(embeddings_array)
+            self.index = index
+            self.index_ids = index_ids
             
             self._save_index()
             
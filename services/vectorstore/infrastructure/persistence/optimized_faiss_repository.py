@@ -1,12 +1,14 @@
 import faiss
 import numpy as np
 import asyncio
-import pickle
-import json
+import hashlib
 import os
-from typing import List, Dict, Any, Optional
+import orjson
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import logging
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 import redis.asyncio as redis
 from sentence_transformers import SentenceTransformer
@@ -15,6 +17,8 @@ from domain.entities.vector_document import SearchResult
 
 from domain.repositories.vector_repository import VectorRepository
 from domain.entities.vector_document import VectorDocument, SearchResult
+from domain.services.token_index import TokenIndex
+from infrastructure.persistence.read_write_lock import ReadWriteLock
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +33,13 @@ class OptimizedFAISSRepository(VectorRepository):
                  index_type: str = "IndexFlatIP",
                  nlist: int = 100,
                  nprobe: int = 10,
-                 cache_ttl: int = 3600):
+                 pq_m: int = 16,
+                 hnsw_m: int = 32,
+                 ef_construction: int = 200,
+                 ef_search: int = 64,
+                 encode_batch_size: int = 128,
+                 cache_ttl: int = 3600,
+                 index_mmap: bool = False):
         
         self.model = SentenceTransformer(model_name)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -39,14 +49,32 @@ class OptimizedFAISSRepository(VectorRepository):
         self.index_type = index_type
         self.nlist = nlist
         self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.encode_batch_size = encode_batch_size
+        self.index_mmap = index_mmap
         
         self.redis_client = redis.Redis(host="redis", port=6379, db=0, decode_responses=True)
         self.cache_ttl = cache_ttl
+        # Версия индекса входит в ключи кэша поиска в Redis: после любого
+        # изменения индекса старые результаты больше не читаются и истекают
+        # по TTL. Начальное значение уникально для процесса, чтобы не читать
+        # ключи, записанные до перезапуска
+        self._index_version = time.time_ns()
         
         self.documents_cache = {}
         self.embeddings_cache = {}
+        self._next_id = 0
+        self.token_index = TokenIndex()
         
         self.executor = ThreadPoolExecutor(max_workers=4)
+        # Поиск и вставки FAISS идут в потоках executor. Поиски только
+        # читают индекс и выполняются параллельно, изменения - монопольно
+        self._index_lock = ReadWriteLock()
+        self._save_lock = threading.Lock()
+        self._rebuild_lock = asyncio.Lock()
         
         self.search_count = 0
         self.cache_hits = 0
@@ -58,46 +86,144 @@ class OptimizedFAISSRepository(VectorRepository):
         """Загрузка существующего индекса"""
         try:
             if os.path.exists("/app/data/faiss_index"):
-                self.index = faiss.read_index("/app/data/faiss_index")
-                logger.info(f"Loaded existing FAISS index with {self.index.ntotal} vectors")
+                # Индекс и документы читаются параллельно: чтение FAISS отпускает GIL
+                index_future = self.executor.submit(self._read_index, "/app/data/faiss_index")
+                documents_future = self.executor.submit(self._read_documents, "/app/data/documents.json")
                 
-                if os.path.exists("/app/data/documents.json"):
-                    with open("/app/data/documents.json", "r", encoding="utf-8") as f:
-                        documents_data = json.load(f)
-                        sorted_docs = sorted(documents_data.items(), key=lambda x: x[0])
-                        
-                        for i, (doc_id, doc_data) in enumerate(sorted_docs):
-                            content = doc_data.get("content") or doc_data.get("text", "")
-                            document = VectorDocument(
-                                id=str(i),  # Используем числовой индекс как ID
-                                content=content,
-                                metadata=doc_data.get("metadata", {})
-                            )
-                            self.documents_cache[str(i)] = document
+                self.index = index_future.result()
+                self._configure_search()
+                logger.info(f"Loaded existing FAISS index with {self.index.ntotal} vectors (mmap={self.index_mmap})")
+                
+                documents_data = documents_future.result()
+                if documents_data is not None:
+                    # Документы сохраняются в порядке векторов индекса
+                    for doc_id, doc_data in documents_data.items():
+                        content = doc_data.get("content") or doc_data.get("text", "")
+                        document = VectorDocument(
+                            id=doc_id,
+                            content=content,
+                            metadata=doc_data.get("metadata", {})
+                        )
+                        self.documents_cache[doc_id] = document
+                    self._next_id = max((int(doc_id) for doc_id in self.documents_cache), default=-1) + 1
+                    self.token_index.add_many(
+                        (doc_id, document.content) for doc_id, document in self.documents_cache.items()
+                    )
                     logger.info(f"Loaded {len(self.documents_cache)} documents from cache with numeric IDs")
+                
+                if not hasattr(self.index, "id_map") and not isinstance(self.index, faiss.IndexIVF):
+                    # Индекс старого формата: позиции векторов соответствуют порядку документов
+                    logger.info("Migrating positional FAISS index to IndexIDMap2")
+                    vectors = self.index.reconstruct_n(0, self.index.ntotal)
+                    self._rebuild_from_vectors(vectors, list(self.documents_cache))
             else:
                 self._create_new_index()
         except Exception as e:
             logger.error(f"Error loading index: {e}")
             self._create_new_index()
     
+    def _read_index(self, path: str):
+        """Прочитать FAISS индекс с диска"""
+        if self.index_mmap:
+            # Страницы индекса отображаются в память и делятся между процессами;
+            # индекс только для чтения, подходит для реплик без записи
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        return faiss.read_index(path)
+    
+    def _read_documents(self, path: str) -> Optional[Dict[str, Any]]:
+        """Прочитать документы индекса с диска"""
+        if not os.path.exists(path):
+            return None
+        # orjson разбирает байты напрямую, без промежуточной строки
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    
     def _create_new_index(self):
         """Создание нового оптимизированного индекса"""
         dimension = self.model.get_sentence_embedding_dimension()
         
+        # Все типы индексов используют скалярное произведение: поиск нормализует
+        # запрос и сравнивает сходство с порогом, L2-расстояние здесь не подходит
         if self.index_type == "IndexIVFFlat":
             quantizer = faiss.IndexFlatIP(dimension)
-            self.index = faiss.IndexIVFFlat(quantizer, dimension, self.nlist)
-            self.index.nprobe = self.nprobe
+            base_index = faiss.IndexIVFFlat(quantizer, dimension, self.nlist, faiss.METRIC_INNER_PRODUCT)
+        elif self.index_type == "IndexIVFPQ":
+            # Векторы сжимаются до pq_m байт: экономия памяти на больших корпусах
+            quantizer = faiss.IndexFlatIP(dimension)
+            base_index = faiss.IndexIVFPQ(quantizer, dimension, self.nlist, self.pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+        elif self.index_type == "IndexIVFSQ8":
+            quantizer = faiss.IndexFlatIP(dimension)
+            base_index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, self.nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+        elif self.index_type == "IndexSQ8":
+            # Один байт на компоненту вместо четырех: полный перебор читает
+            # в 4 раза меньше памяти, расстояния считаются SIMD-ядрами FAISS
+            base_index = faiss.IndexScalarQuantizer(
+                dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
         elif self.index_type == "IndexHNSW":
-            self.index = faiss.IndexHNSWFlat(dimension, 32)  # 32 соседа
-            self.index.hnsw.efConstruction = 200
-            self.index.hnsw.efSearch = 100
+            base_index = faiss.IndexHNSWFlat(dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            base_index.hnsw.efConstruction = self.ef_construction
         else:
-            self.index = faiss.IndexFlatIP(dimension)
+            base_index = faiss.IndexFlatIP(dimension)
         
+        # Векторы хранятся под ID документов: поиск сразу возвращает ID,
+        # а удаление не сдвигает позиции остальных документов. IVF хранит
+        # ID в инвертированных списках сам и не сжимает позиции при удалении,
+        # поэтому обертка IndexIDMap2 ему не нужна и не подходит
+        if isinstance(base_index, faiss.IndexIVF):
+            self.index = base_index
+        else:
+            self.index = faiss.IndexIDMap2(base_index)
+        self._configure_search()
+        self._index_version += 1
         logger.info(f"Created new {self.index_type} index with dimension {dimension}")
     
+    def _base_index(self):
+        """Индекс под отображением ID"""
+        return faiss.downcast_index(self.index.index) if hasattr(self.index, "id_map") else self.index
+    
+    def _configure_search(self):
+        """Применить параметры поиска к графовому или IVF индексу"""
+        base_index = self._base_index()
+        if hasattr(base_index, "hnsw"):
+            base_index.hnsw.efSearch = self.ef_search
+        if hasattr(base_index, "nprobe"):
+            base_index.nprobe = self.nprobe
+    
+    def _add_embeddings(self, embeddings: np.ndarray, doc_ids: List[str]):
+        """Добавить векторы под ID документов, обучив IVF индекс на первой партии"""
+        with self._index_lock.write():
+            self._add_to_index(embeddings, doc_ids)
+    
+    def _add_to_index(self, embeddings: np.ndarray, doc_ids: List[str]):
+        """Добавить векторы в индекс; вызывается под блокировкой на запись"""
+        ids = np.array([int(doc_id) for doc_id in doc_ids], dtype=np.int64)
+        if not self.index.is_trained:
+            if isinstance(self.index, faiss.IndexIVF) and len(embeddings) < self.nlist:
+                raise ValueError(
+                    f"{self.index_type} requires at least {self.nlist} vectors for training, got {len(embeddings)}"
+                )
+            self.index.train(embeddings)
+        self.index.add_with_ids(embeddings, ids)
+        self._index_version += 1
+    
+    def _remove_ids(self, doc_ids: List[str]):
+        """Удалить векторы документов из индекса"""
+        with self._index_lock.write():
+            self.index.remove_ids(np.array([int(doc_id) for doc_id in doc_ids], dtype=np.int64))
+            self._index_version += 1
+    
+    def _search_cache_key(self, query_embedding, top_k: int, threshold: float) -> str:
+        """Ключ кэша результатов поиска для текущей версии индекса"""
+        return f"search:{self._index_version}:{hash(tuple(query_embedding))}:{top_k}:{threshold}"
+    
+    def _search_index(self, query_vectors: np.ndarray, k: int):
+        """Поиск в индексе; FAISS отпускает GIL, поэтому выполняется в executor"""
+        with self._index_lock.read():
+            return self.index.search(query_vectors, k)
+    
     async def save_document(self, document: VectorDocument) -> str:
         """Сохранение документа с оптимизацией"""
         try:
@@ -105,20 +231,19 @@ class OptimizedFAISSRepository(VectorRepository):
             
             embedding_array = np.array([embedding], dtype=np.float32)
             
-            if self.index_type == "IndexIVFFlat" and not self.index.is_trained:
-                self.index.train(embedding_array)
-            
-            self.index.add(embedding_array)
-            
-            doc_id = str(len(self.documents_cache))
-            self.documents_cache[doc_id] = document
-            document.id = doc_id
+            async with self._rebuild_lock:
+                doc_id = self._allocate_id()
+                self._add_embeddings(embedding_array, [doc_id])
+                
+                self.documents_cache[doc_id] = document
+                document.id = doc_id
+                self.token_index.add(doc_id, document.content)
             
             cache_key = f"embedding:{doc_id}"
             await self.redis_client.setex(
                 cache_key, 
                 self.cache_ttl, 
-                json.dumps(embedding.tolist())
+                orjson.dumps(embedding)
             )
             
             await self._save_index_async()
@@ -134,71 +259,51 @@ class OptimizedFAISSRepository(VectorRepository):
                            top_k: int = 5, threshold: float = 0.3) -> List[SearchResult]:
         """Оптимизированный поиск с кэшированием"""
         
-        logger.info(f"OptimizedFAISSRepository: starting search with top_k={top_k}, threshold={threshold}")
+        logger.debug("OptimizedFAISSRepository: starting search with top_k=%d, threshold=%s", top_k, threshold)
         
-        query_hash = hash(tuple(query_embedding))
-        cache_key = f"search:{query_hash}:{top_k}:{threshold}"
+        cache_key = self._search_cache_key(query_embedding, top_k, threshold)
         
         cached_result = await self.redis_client.get(cache_key)
         if cached_result:
             self.cache_hits += 1
-            logger.info("OptimizedFAISSRepository: returning cached result")
-            cached_data = json.loads(cached_result)
-            results = []
-            for item in cached_data:
-                result = SearchResult(
-                    document_id=item["document_id"],
-                    content=item["content"],
-                    relevance_score=item["relevance_score"],
-                    metadata=item["metadata"],
-                    distance=item.get("distance")
-                )
-                results.append(result)
-            return results
+            logger.debug("OptimizedFAISSRepository: returning cached result")
+            return self._deserialize_results(cached_result)
         
         self.cache_misses += 1
         self.search_count += 1
         
         try:
-            logger.info(f"Starting search with query embedding length: {len(query_embedding)}")
+            logger.debug("Starting search with query embedding length: %d", len(query_embedding))
             
             query_vector = np.array(query_embedding, dtype=np.float32)
             query_vector = query_vector / np.linalg.norm(query_vector)
             
             search_k = min(top_k * 2, self.index.ntotal)
-            logger.info(f"Searching FAISS index with k={search_k}, total vectors={self.index.ntotal}")
+            logger.debug("Searching FAISS index with k=%d, total vectors=%d", search_k, self.index.ntotal)
             
-            similarities, indices = self.index.search(
-                query_vector.reshape(1, -1), 
+            loop = asyncio.get_running_loop()
+            similarities, indices = await loop.run_in_executor(
+                self.executor,
+                self._search_index,
+                query_vector.reshape(1, -1),
                 search_k
             )
             
-            results = []
-            logger.info(f"Search: found {len(similarities[0])} candidates, threshold={threshold}, cache_size={len(self.documents_cache)}")
-            
-            for i, (similarity, idx) in enumerate(zip(similarities[0], indices[0])):
-                if similarity >= threshold and len(results) < top_k:
-                    doc_id = str(idx)
-                    document = self.documents_cache.get(doc_id)
-                    
-                    if document:
-                        result = SearchResult(
-                            document_id=doc_id,
-                            content=document.content,
-                            metadata=document.metadata,
-                            relevance_score=float(similarity)
-                        )
-                        results.append(result)
-                    else:
-                        logger.warning(f"Document {doc_id} not found in cache")
+            logger.debug("Search: found %d candidates, threshold=%s, cache_size=%d", len(similarities[0]), threshold, len(self.documents_cache))
+            
+            results = self._collect_results(similarities[0], indices[0], top_k, threshold)
             
             await self.redis_client.setex(
                 cache_key, 
                 self.cache_ttl, 
-                json.dumps([result.__dict__ for result in results])
+                orjson.dumps([result.__dict__ for result in results])
             )
             
-            logger.info(f"Search completed: {len(results)} results, similarity range: {min(similarities[0]):.3f}-{max(similarities[0]):.3f}")
+            if logger.isEnabledFor(logging.DEBUG) and search_k > 0:
+                logger.debug(
+                    "Search completed: %d results, similarity range: %.3f-%.3f",
+                    len(results), similarities[0].min(), similarities[0].max()
+                )
             return results
             
         except Exception as e:
@@ -207,15 +312,127 @@ class OptimizedFAISSRepository(VectorRepository):
             logger.error(f"Traceback: {traceback.format_exc()}")
             return []
     
+    async def search_similar_batch(self, query_embeddings: np.ndarray,
+                                   top_k: int = 5, threshold: float = 0.3) -> List[List[SearchResult]]:
+        """Пакетный поиск: один вызов FAISS на все некэшированные запросы"""
+        cache_keys = [
+            self._search_cache_key(embedding.tolist(), top_k, threshold)
+            for embedding in query_embeddings
+        ]
+        
+        cached_results = await self.redis_client.mget(cache_keys)
+        results: List[Optional[List[SearchResult]]] = [None] * len(cache_keys)
+        misses = []
+        
+        for i, cached_result in enumerate(cached_results):
+            if cached_result:
+                self.cache_hits += 1
+                results[i] = self._deserialize_results(cached_result)
+            else:
+                misses.append(i)
+        
+        if not misses:
+            return results
+        
+        self.cache_misses += len(misses)
+        self.search_count += len(misses)
+        
+        try:
+            query_vectors = np.asarray(query_embeddings, dtype=np.float32)[misses]
+            faiss.normalize_L2(query_vectors)
+            
+            search_k = min(top_k * 2, self.index.ntotal)
+            if search_k > 0:
+                loop = asyncio.get_running_loop()
+                similarities, indices = await loop.run_in_executor(
+                    self.executor, self._search_index, query_vectors, search_k
+                )
+            
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for row, i in enumerate(misses):
+                results[i] = (
+                    self._collect_results(similarities[row], indices[row], top_k, threshold)
+                    if search_k > 0 else []
+                )
+                pipeline.setex(
+                    cache_keys[i],
+                    self.cache_ttl,
+                    orjson.dumps([result.__dict__ for result in results[i]])
+                )
+            await pipeline.execute()
+            
+            logger.debug("Batch search completed: %d queries, %d searched in FAISS", len(cache_keys), len(misses))
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error in batch search: {e}")
+            raise
+    
+    def search_keywords(self, query: str, limit: int = 10) -> List[SearchResult]:
+        """Точный поиск по словам через инвертированный индекс"""
+        results = []
+        for doc_id in self.token_index.search(query)[:limit]:
+            document = self.documents_cache.get(doc_id)
+            if document:
+                results.append(SearchResult(
+                    document_id=doc_id,
+                    content=document.content,
+                    metadata=document.metadata,
+                    relevance_score=1.0
+                ))
+        return results
+    
+    def _collect_results(self, similarities: np.ndarray, indices: np.ndarray,
+                         top_k: int, threshold: float) -> List[SearchResult]:
+        """Отобрать документы кандидатов выше порога"""
+        # Порог и пустые позиции (-1) отсекаются одной векторной маской,
+        # объекты результатов создаются только для прошедших кандидатов;
+        # индекс возвращает ID документов, а не позиции векторов
+        keep = np.flatnonzero((similarities >= threshold) & (indices >= 0))
+        results = []
+        
+        for idx, similarity in zip(indices[keep].tolist(), similarities[keep].tolist()):
+            doc_id = str(idx)
+            document = self.documents_cache.get(doc_id)
+            
+            if document:
+                results.append(SearchResult(
+                    document_id=doc_id,
+                    content=document.content,
+                    metadata=document.metadata,
+                    relevance_score=similarity
+                ))
+                if len(results) == top_k:
+                    break
+            else:
+                logger.warning(f"Document {doc_id} not found in cache")
+        
+        return results
+    
+    def _deserialize_results(self, cached_result: str) -> List[SearchResult]:
+        """Восстановить результаты поиска из кэша"""
+        return [
+            SearchResult(
+                document_id=item["document_id"],
+                content=item["content"],
+                relevance_score=item["relevance_score"],
+                metadata=item["metadata"],
+                distance=item.get("distance")
+            )
+            for item in orjson.loads(cached_result)
+        ]
+    
     async def _generate_embedding(self, text: str) -> List[float]:
         """Генерация эмбеддинга с кэшированием"""
         
-        text_hash = hash(text)
+        # Стабильный хэш: встроенный hash() меняется между процессами,
+        # и кэш в Redis не находился бы после перезапуска или в другом воркере
+        text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
         cache_key = f"embedding_gen:{text_hash}"
         
         cached_embedding = await self.redis_client.get(cache_key)
         if cached_embedding:
-            return json.loads(cached_embedding)
+            return orjson.loads(cached_embedding)
         
         loop = asyncio.get_event_loop()
         embedding = await loop.run_in_executor(
@@ -223,45 +440,54 @@ class OptimizedFAISSRepository(VectorRepository):
             self._generate_embedding_sync,
             text
         )
+        embedding_list = embedding.tolist()
         
         await self.redis_client.setex(
             cache_key, 
             self.cache_ttl, 
-            json.dumps(embedding.tolist())
+            orjson.dumps(embedding_list)
         )
         
-        return embedding.tolist()
+        return embedding_list
     
     def _generate_embedding_sync(self, text: str) -> np.ndarray:
         """Синхронная генерация эмбеддинга"""
         with torch.no_grad():
-            embedding = self.model.encode(text, convert_to_numpy=True)
+            # Как и при пакетном добавлении: в индексе только единичные векторы
+            embedding = self.model.encode(text, convert_to_numpy=True, normalize_embeddings=True)
             return embedding
     
     async def _save_index_async(self):
         """Асинхронное сохранение индекса"""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self._save_index)
+    
+    def _save_index(self):
+        """Сохранение индекса и документов на диск"""
+        # Сохранения из разных потоков executor не пишут файлы одновременно
+        with self._save_lock:
+            self._write_index_files()
+    
+    def _write_index_files(self):
+        """Записать индекс и документы; вызывается под блокировкой сохранения"""
         try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                self.executor,
-                faiss.write_index,
-                self.index,
-                "/app/data/faiss_index"
-            )
+            with self._index_lock.read():
+                faiss.write_index(self.index, "/app/data/faiss_index")
             
+            saved_at = datetime.now().isoformat()
             documents_data = {}
-            for doc_id, document in self.documents_cache.items():
+            # Снимок кэша: event loop может менять словарь во время сохранения
+            for doc_id, document in list(self.documents_cache.items()):
                 documents_data[doc_id] = {
                     "id": doc_id,
                     "text": document.content,  # Используем "text" для совместимости
                     "metadata": document.metadata,
-                    "created_at": datetime.now().isoformat()
+                    "created_at": saved_at
                 }
             
-            await loop.run_in_executor(
-                self.executor,
-                lambda: json.dump(documents_data, open("/app/data/documents.json", "w", encoding="utf-8"), ensure_ascii=False, indent=2)
-            )
+            # Компактный UTF-8 без отступов: файл меньше, запись и чтение быстрее
+            with open("/app/data/documents.json", "wb") as f:
+                f.write(orjson.dumps(documents_data))
             
             logger.info("Index and documents saved successfully")
         except Exception as e:
@@ -290,24 +516,46 @@ class OptimizedFAISSRepository(VectorRepository):
         except:
             return 0.0
     
-    async def rebuild_index(self):
+    async def rebuild_index(self) -> bool:
         """Перестроение индекса с оптимизацией"""
         logger.info("Starting index rebuild...")
         
-        self._create_new_index()
-        
-        for doc_id, document in self.documents_cache.items():
-            embedding = await self._generate_embedding(document.content)
-            embedding_array = np.array([embedding], dtype=np.float32)
+        try:
+            loop = asyncio.get_running_loop()
+            # Добавления и обновления ждут конца пересборки, иначе их векторы
+            # попали бы в старый индекс и потерялись при замене
+            async with self._rebuild_lock:
+                documents = list(self.documents_cache.items())
+                
+                # Весь корпус кодируется до пересборки: пока идет кодирование,
+                # поиски работают со старым индексом
+                embeddings = np.empty((0, 0), dtype=np.float32)
+                if documents:
+                    embeddings = await loop.run_in_executor(
+                        self.executor,
+                        self._encode_documents,
+                        [document.content for _, document in documents]
+                    )
+                
+                # Удаленные за время кодирования документы в индекс не возвращаются
+                keep = [i for i, (doc_id, _) in enumerate(documents) if doc_id in self.documents_cache]
+                
+                # IVF обучается на всем корпусе, а создание индекса и вставка
+                # векторов идут под одной блокировкой на запись
+                await loop.run_in_executor(
+                    self.executor,
+                    self._rebuild_from_vectors,
+                    embeddings[keep],
+                    [documents[i][0] for i in keep]
+                )
             
-            if self.index_type == "IndexIVFFlat" and not self.index.is_trained:
-                self.index.train(embedding_array)
+            await self._save_index_async()
             
-            self.index.add(embedding_array)
-        
-        await self._save_index_async()
-        
-        logger.info(f"Index rebuild completed: {self.index.ntotal} vectors")
+            logger.info(f"Index rebuild completed: {self.index.ntotal} vectors")
+            return True
+        except Exception as e:
+            logger.error(f"Error rebuilding index: {e}")
+            return False
     
     async def optimize_memory(self):
         """Оптимизация памяти"""
@@ -327,51 +575,163 @@ class OptimizedFAISSRepository(VectorRepository):
         """Получить документ по ID"""
         return self.documents_cache.get(document_id)
     
-    def add_documents(self, documents: List[VectorDocument]) -> List[str]:
-        """Добавить несколько документов"""
-        document_ids = []
-        for document in documents:
-            try:
-                doc_id = asyncio.run(self.save_document(document))
-                document_ids.append(doc_id)
-            except Exception as e:
-                logger.error(f"Error adding document: {e}")
-        return document_ids
-    
-    def update_document(self, document_id: str, document: VectorDocument) -> bool:
+    async def add_documents(self, documents: List[VectorDocument]) -> List[str]:
+        """Добавить несколько документов одним пакетом векторов"""
+        if not documents:
+            return []
+        
+        document_ids: List[str] = []
+        try:
+            loop = asyncio.get_running_loop()
+            missing = [document for document in documents if document.embedding is None]
+            if missing:
+                embeddings = await loop.run_in_executor(
+                    self.executor,
+                    self._encode_documents,
+                    [document.content for document in missing]
+                )
+                for document, embedding in zip(missing, embeddings):
+                    document.update_embedding(embedding.tolist())
+            
+            # Эмбеддинги уже посчитаны пакетом в VectorService: повторно не кодируем
+            # и добавляем все векторы в индекс одним вызовом
+            async with self._rebuild_lock:
+                document_ids = [self._allocate_id() for _ in documents]
+                for doc_id, document in zip(document_ids, documents):
+                    document.id = doc_id
+                    self.documents_cache[doc_id] = document
+                    self.token_index.add(doc_id, document.content)
+                
+                # Блокировка на запись ждет завершения текущих поисков:
+                # вставка идет в executor и не останавливает event loop
+                await loop.run_in_executor(
+                    self.executor,
+                    self._add_embeddings,
+                    np.array([document.embedding for document in documents], dtype=np.float32),
+                    document_ids
+                )
+            
+            await self._save_index_async()
+            
+            logger.info(f"Added {len(document_ids)} documents in one batch")
+            return document_ids
+            
+        except Exception as e:
+            logger.error(f"Error adding documents: {e}")
+            # Документы без векторов в индексе не остаются в кэше
+            for doc_id in document_ids:
+                self.documents_cache.pop(doc_id, None)
+                self.token_index.remove(doc_id)
+            return []
+    
+    def _encode_documents(self, texts: List[str]) -> np.ndarray:
+        """Пакетное кодирование документов в нормализованные векторы"""
+        with torch.no_grad():
+            return self.model.encode(
+                texts,
+                batch_size=self.encode_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+    
+    async def update_document(self, document_id: str, document: VectorDocument) -> bool:
         """Обновить документ"""
         try:
-            if document_id in self.documents_cache:
-                self.delete_document(document_id)
-                asyncio.run(self.save_document(document))
-                return True
-            return False
+            if document_id not in self.documents_cache:
+                return False
+            
+            loop = asyncio.get_running_loop()
+            if document.embedding is None:
+                embeddings = await loop.run_in_executor(
+                    self.executor, self._encode_documents, [document.content]
+                )
+                document.update_embedding(embeddings[0].tolist())
+            
+            async with self._rebuild_lock:
+                # Замена вектора ждет блокировку на запись: выполняется в executor
+                await loop.run_in_executor(
+                    self.executor,
+                    self._replace_embedding,
+                    document_id,
+                    np.array([document.embedding], dtype=np.float32)
+                )
+                
+                document.id = document_id
+                self.documents_cache[document_id] = document
+                self.token_index.add(document_id, document.content)
+            await self._save_index_async()
+            return True
         except Exception as e:
             logger.error(f"Error updating document: {e}")
             return False
     
+    def _replace_embedding(self, document_id: str, embedding: np.ndarray):
+        """Заменить вектор документа, сохранив его ID"""
+        if self._supports_remove():
+            self._remove_ids([document_id])
+            self._add_embeddings(embedding, [document_id])
+        else:
+            vectors, doc_ids = self._reconstruct_vectors()
+            vectors[doc_ids.index(document_id)] = embedding[0]
+            self._rebuild_from_vectors(vectors, doc_ids)
+    
     def delete_document(self, document_id: str) -> bool:
         """Удалить документ"""
         try:
             if document_id in self.documents_cache:
                 del self.documents_cache[document_id]
+                self.token_index.remove(document_id)
                 self._rebuild_index_without_document(document_id)
+                self._save_index()
                 return True
             return False
         except Exception as e:
             logger.error(f"Error deleting document: {e}")
             return False
     
+    def _allocate_id(self) -> str:
+        """Выдать новый ID документа; ID удаленных документов не переиспользуются"""
+        doc_id = str(self._next_id)
+        self._next_id += 1
+        return doc_id
+    
+    def _supports_remove(self) -> bool:
+        """Поддерживает ли индекс удаление векторов по ID"""
+        # Граф HNSW не поддерживает удаление вершин
+        return not hasattr(self._base_index(), "hnsw")
+    
+    def _reconstruct_vectors(self) -> Tuple[np.ndarray, List[str]]:
+        """Получить все векторы индекса и ID их документов"""
+        with self._index_lock.read():
+            base_index = self._base_index()
+            doc_ids = [str(doc_id) for doc_id in faiss.vector_to_array(self.index.id_map)]
+            return base_index.reconstruct_n(0, base_index.ntotal), doc_ids
+    
+    def _rebuild_from_vectors(self, vectors: np.ndarray, doc_ids: List[str]):
+        """Пересоздать индекс из готовых векторов"""
+        # Поиски ждут окончания пересборки и не видят пустой индекс
+        with self._index_lock.write():
+            self._create_new_index()
+            if len(vectors):
+                self._add_to_index(np.ascontiguousarray(vectors, dtype=np.float32), doc_ids)
+    
     def get_all_documents(self) -> List[VectorDocument]:
         """Получить все документы"""
         return list(self.documents_cache.values())
     
-    def clear_index(self) -> bool:
+    async def clear_index(self) -> bool:
         """Очистить индекс"""
         try:
+            # Пустой индекс создается под блокировкой на запись в executor:
+            # поиски не застают индекс в момент замены
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._rebuild_from_vectors, np.empty((0, 0)), [])
+            
             self.documents_cache.clear()
             self.embeddings_cache.clear()
-            self._create_new_index()
+            self.token_index.clear()
+            await self._save_index_async()
             return True
         except Exception as e:
             logger.error(f"Error clearing index: {e}")
@@ -380,30 +740,25 @@ class OptimizedFAISSRepository(VectorRepository):
     def _rebuild_index_without_document(self, document_id: str):
         """Пересоздать индекс без указанного документа"""
         try:
-            self._create_new_index()
+            if self._supports_remove():
+                self._remove_ids([document_id])
+                return
             
-            for doc_id, document in self.documents_cache.items():
-                if doc_id != document_id:
-                    embedding = asyncio.run(self._generate_embedding(document.content))
-                    embedding_array = np.array([embedding], dtype=np.float32)
-                    self.index.add(embedding_array)
+            # Векторы остальных документов берутся из индекса: без повторного
+            # кодирования всего корпуса на каждое удаление
+            vectors, doc_ids = self._reconstruct_vectors()
+            position = doc_ids.index(document_id)
+            self._rebuild_from_vectors(
+                np.delete(vectors, position, axis=0),
+                doc_ids[:position] + doc_ids[position + 1:]
+            )
         except Exception as e:
             logger.error(f"Error rebuilding index without document: {e}")
     
     async def _rebuild_index_async(self):
         """Асинхронное пересоздание индекса"""
-        try:
-            documents = list(self.documents_cache.values())
-            
-            self.documents_cache.clear()
-            self.embeddings_cache.clear()
-            
-            self._create_new_index()
-            
-            for document in documents:
-                await self.save_document(document)
-                
-            logger.info("Index rebuilt successfully")
-        except Exception as e:
-            logger.error(f"Error rebuilding index: {e}")
-            raise
+        self.embeddings_cache.clear()
+        # Документы сохраняют свои ID: индекс пересобирается целиком,
+        # без промежуточного пустого состояния
+        if not await self.rebuild_index():
+            raise RuntimeError("Failed to rebuild index")